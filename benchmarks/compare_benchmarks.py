@@ -0,0 +1,53 @@
+'''
+Compares two result files of run_benchmarks.py, e.g. of two commits.
+
+Usage:
+    python benchmarks/compare_benchmarks.py results/abc1234_20200101120000.json results/def5678_20200102120000.json
+'''
+
+import argparse
+import json
+import sys
+
+#%%
+def compare(path_base, path_new, threshold=0.1):
+    '''
+    Prints the ratio new / base of wall time and peak memory of all benchmarks present in both result files.
+    Returns the benchmarks of which wall time or peak memory increased more than threshold.
+    '''
+
+    with open(path_base) as file:
+        base = json.load(file)
+    with open(path_new) as file:
+        new = json.load(file)
+    base_results = {(result['benchmark'], result['scale']): result for result in base['results'] if result['status'] == 'ok'}
+
+    print('Comparing', new['commit'], 'to', base['commit'])
+    print('   ', 'benchmark'.ljust(28), 'scale'.rjust(10), 'time'.rjust(8), 'memory'.rjust(8))
+    regressions = []
+    for result in new['results']:
+        key = (result['benchmark'], result['scale'])
+        if result['status'] != 'ok' or key not in base_results:
+            continue
+        time_ratio = result['wall_time_s'] / base_results[key]['wall_time_s']
+        memory_ratio = result['peak_memory_mb'] / max(base_results[key]['peak_memory_mb'], 1e-6)
+        regression = (time_ratio > 1 + threshold) or (memory_ratio > 1 + threshold)
+        if regression:
+            regressions.append(key)
+        print('   ', key[0].ljust(28), str(key[1]).rjust(10), ('%.2fx' % time_ratio).rjust(8), ('%.2fx' % memory_ratio).rjust(8), '<--' if regression else '')
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Compare two pyhydro benchmark result files.')
+    parser.add_argument('base', help='Result file of the base commit.')
+    parser.add_argument('new', help='Result file of the new commit.')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative increase that counts as regression. The default is 0.1.')
+    args = parser.parse_args(args)
+
+    regressions = compare(args.base, args.new, args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
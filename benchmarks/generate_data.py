@@ -0,0 +1,296 @@
+'''
+Deterministic generators of synthetic iMOD and KNMI files for the pyhydro benchmarks.
+All generators take a seed, so the same scale always gives the same file.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+#%%
+## Model grid of the synthetic data, in RD_new coordinates.
+GRID_X0 = 140000.
+GRID_Y0 = 450000.
+GRID_DX = 25.
+NLAY = 7
+
+IFF_COLUMNS = ['PARTICLE_NUMBER', 'IROW', 'ICOL', 'ILAY', 'XCRD.', 'YCRD.', 'ZCRD.', 'TIME(YEARS)', 'VELOCITY(M/DAY)']
+IPF_COLUMNS = ['SP_XCRD.', 'SP_YCRD.', 'SP_ZCRD.', 'SP_ILAY', 'SP_IROW', 'SP_ICOL',
+               'EP_XCRD.', 'EP_YCRD.', 'EP_ZCRD.', 'EP_ILAY', 'EP_IROW', 'EP_ICOL',
+               'TIME(YEARS)', 'MAXLAYER', 'DISTANCE', 'IDENT.NO.', 'CAPTURED_BY']
+KNMI_DAILY_COLUMNS = ['DDVEC', 'FHVEC', 'FG', 'FHX', 'FHXH', 'FHN', 'FHNH', 'FXX', 'FXXH', 'TG', 'TN', 'TNH', 'TX', 'TXH',
+                      'T10N', 'T10NH', 'SQ', 'SP', 'Q', 'DR', 'RH', 'RHX', 'RHXH', 'PG', 'PX', 'PXH', 'PN', 'PNH',
+                      'VVN', 'VVNH', 'VVX', 'VVXH', 'NG', 'UG', 'UX', 'UXH', 'UN', 'UNH', 'EV24']
+KNMI_HOURLY_COLUMNS = ['DD', 'FH', 'FF', 'FX', 'T', 'T10N', 'TD', 'SQ', 'Q', 'DR', 'RH', 'P', 'VV', 'N', 'U',
+                       'WW', 'IX', 'M', 'R', 'S', 'O', 'Y']
+
+## Period of each synthetic KNMI station. Larger files are spread over several stations, so all dates are valid.
+KNMI_DAILY_PERIOD = ('1901-01-01', '2020-12-31')
+KNMI_HOURLY_PERIOD = ('1951-01-01', '2020-12-31')
+KNMI_FIRST_STATION = 200
+
+## Number of rows generated and written at once.
+BATCH_SIZE = 1000000
+
+
+def get_well_cells(n_wells=10, nrow=400, ncol=400):
+    '''
+    Returns the [row, column] cells of the synthetic wells, in the center part of the model grid.
+    '''
+
+    rng = np.random.default_rng(0)
+    rows = rng.integers(nrow // 4, 3 * nrow // 4, n_wells) + 1
+    cols = rng.integers(ncol // 4, 3 * ncol // 4, n_wells) + 1
+    return [[int(row), int(col)] for row, col in zip(rows, cols)]
+
+
+def get_wells(n_wells=10, nrow=400, ncol=400):
+    '''
+    Returns a dataframe with the synthetic wells, with columns Name, X, Y, IROW and ICOL.
+    '''
+
+    well_cells = np.array(get_well_cells(n_wells, nrow, ncol))
+    wells = pd.DataFrame({'Name': ['WELL' + str(i).zfill(3) for i in range(n_wells)],
+                          'X': GRID_X0 + (well_cells[:, 1] - 0.5) * GRID_DX,
+                          'Y': GRID_Y0 - (well_cells[:, 0] - 0.5) * GRID_DX,
+                          'IROW': well_cells[:, 0].astype(float),
+                          'ICOL': well_cells[:, 1].astype(float)})
+    return wells
+
+
+def _write_table(path, data, mode='a', chunksize=1000000):
+    '''
+    Appends a dataframe as whitespace separated text to path, in chunks to limit memory.
+    '''
+
+    with open(path, mode) as file:
+        for start in range(0, len(data), chunksize):
+            data.iloc[start:start+chunksize].to_csv(file, sep=' ', header=False, index=False, float_format='%.6f')
+
+
+def write_iff(path, n_rows, points_per_particle=50, n_wells=10, nrow=400, ncol=400, seed=0):
+    '''
+    Writes a synthetic .iff iMOD flowpath file with n_rows rows.
+    Most flowpaths end in one of the wells of get_well_cells, the others end at a random location.
+    '''
+
+    rng = np.random.default_rng(seed)
+    n_particles = max(n_rows // points_per_particle, 1)
+    with open(path, 'w') as file:
+        file.write(str(len(IFF_COLUMNS)) + '\n')
+        for column in IFF_COLUMNS:
+            file.write(column + '\n')
+
+    ## Generate particles in batches, so memory is bounded for large files.
+    well_cells = np.array(get_well_cells(n_wells, nrow, ncol))
+    batch = max(BATCH_SIZE // points_per_particle, 1)
+    for first in range(0, n_particles, batch):
+        n = min(batch, n_particles - first)
+        end_well = rng.integers(0, n_wells, n)
+        captured = rng.random(n) < 0.8
+        end_row = np.where(captured, well_cells[end_well, 0], rng.integers(1, nrow + 1, n))
+        end_col = np.where(captured, well_cells[end_well, 1], rng.integers(1, ncol + 1, n))
+
+        ## Random walk backwards from the endpoint, with increasing travel time.
+        steps_x = rng.normal(0, GRID_DX, (n, points_per_particle))
+        steps_y = rng.normal(0, GRID_DX, (n, points_per_particle))
+        steps_x[:, -1] = 0
+        steps_y[:, -1] = 0
+        x = GRID_X0 + (end_col[:, np.newaxis] - 0.5) * GRID_DX - np.cumsum(steps_x[:, ::-1], axis=1)[:, ::-1]
+        y = GRID_Y0 - (end_row[:, np.newaxis] - 0.5) * GRID_DX - np.cumsum(steps_y[:, ::-1], axis=1)[:, ::-1]
+        x = np.clip(x, GRID_X0, GRID_X0 + ncol * GRID_DX - 1e-3)
+        y = np.clip(y, GRID_Y0 - nrow * GRID_DX + 1e-3, GRID_Y0)
+        time = np.cumsum(rng.exponential(0.5, (n, points_per_particle)), axis=1)
+        time = time - time[:, :1]
+        layer = np.clip(np.round(np.linspace(1, rng.integers(1, NLAY + 1, n), points_per_particle).T), 1, NLAY)
+
+        data = pd.DataFrame({'PARTICLE_NUMBER': np.repeat(np.arange(first, first + n) + 1, points_per_particle),
+                             'IROW': ((GRID_Y0 - y) // GRID_DX + 1).astype(int).ravel(),
+                             'ICOL': ((x - GRID_X0) // GRID_DX + 1).astype(int).ravel(),
+                             'ILAY': layer.astype(int).ravel(),
+                             'XCRD.': x.ravel(),
+                             'YCRD.': y.ravel(),
+                             'ZCRD.': (-10. * layer + rng.normal(0, 1, layer.shape)).ravel(),
+                             'TIME(YEARS)': time.ravel(),
+                             'VELOCITY(M/DAY)': rng.exponential(0.1, n * points_per_particle)})
+        _write_table(path, data)
+    return path
+
+
+def write_ipf(path, n_rows, n_wells=10, nrow=400, ncol=400, seed=0):
+    '''
+    Writes a synthetic .ipf iMOD flowpath file with n_rows starting points.
+    Starting points are located on a regular grid, endpoints are mostly located at the wells of get_well_cells.
+    '''
+
+    rng = np.random.default_rng(seed)
+    well_cells = np.array(get_well_cells(n_wells, nrow, ncol))
+    ncol_sp = int(np.ceil(np.sqrt(n_rows)))
+    dx_sp = ncol * GRID_DX / ncol_sp
+    with open(path, 'w') as file:
+        file.write(str(n_rows).rjust(10) + '\n')
+        file.write(str(len(IPF_COLUMNS)) + '\n')
+        for column in IPF_COLUMNS:
+            file.write(column + '\n')
+        file.write('0,TXT\n')
+
+    ## Generate starting points in batches, so memory is bounded for large files.
+    for first in range(0, n_rows, BATCH_SIZE):
+        n = min(BATCH_SIZE, n_rows - first)
+        number = np.arange(first, first + n)
+        sp_row = number // ncol_sp + 1
+        sp_col = number % ncol_sp + 1
+        end_well = rng.integers(0, n_wells, n)
+        captured = rng.random(n) < 0.8
+        ep_row = np.where(captured, well_cells[end_well, 0], rng.integers(1, nrow + 1, n))
+        ep_col = np.where(captured, well_cells[end_well, 1], rng.integers(1, ncol + 1, n))
+
+        data = pd.DataFrame({'SP_XCRD.': GRID_X0 + (sp_col - 0.5) * dx_sp,
+                             'SP_YCRD.': GRID_Y0 - (sp_row - 0.5) * dx_sp,
+                             'SP_ZCRD.': rng.uniform(-60, -10, n),
+                             'SP_ILAY': rng.integers(1, NLAY + 1, n),
+                             'SP_IROW': sp_row,
+                             'SP_ICOL': sp_col,
+                             'EP_XCRD.': GRID_X0 + (ep_col - 0.5) * GRID_DX,
+                             'EP_YCRD.': GRID_Y0 - (ep_row - 0.5) * GRID_DX,
+                             'EP_ZCRD.': rng.uniform(-100, -60, n),
+                             'EP_ILAY': rng.integers(1, NLAY + 1, n),
+                             'EP_IROW': ep_row,
+                             'EP_ICOL': ep_col,
+                             'TIME(YEARS)': rng.exponential(25, n),
+                             'MAXLAYER': NLAY,
+                             'DISTANCE': rng.exponential(500, n),
+                             'IDENT.NO.': number + 1,
+                             'CAPTURED_BY': np.where(captured, NLAY, 0)})
+        _write_table(path, data)
+    return path
+
+
+def write_idf(path, n_cells, seed=0):
+    '''
+    Writes a synthetic square .idf raster with approximately n_cells cells. Requires imod.
+    '''
+
+    import imod
+    import xarray as xr
+
+    rng = np.random.default_rng(seed)
+    n = max(int(np.sqrt(n_cells)), 2)
+    xs = GRID_X0 + (np.arange(n) + 0.5) * GRID_DX
+    ys = GRID_Y0 - (np.arange(n) + 0.5) * GRID_DX
+    values = rng.normal(0, 1, (n, n)).astype(np.float32)
+    imod.idf.write(path, xr.DataArray(values, coords={'y': ys, 'x': xs}, dims=('y', 'x')))
+    return path
+
+
+def _get_KNMI_values(rng, n_rows, columns):
+    '''
+    Returns random integer KNMI values, with -1 for small amounts of precipitation and sunshine, and some missing values.
+    Values are nullable integers, so missing values are written as empty fields.
+    '''
+
+    values = rng.integers(0, 300, (n_rows, len(columns)))
+    for column in ['SQ', 'RH', 'RHX']:
+        if column in columns:
+            values[rng.random(n_rows) < 0.1, columns.index(column)] = -1
+    if 'T10NH' in columns:
+        values[:, columns.index('T10NH')] = rng.choice([6, 12, 18, 24], n_rows)
+    data = pd.DataFrame(values, columns=columns).astype('Int64')
+    return data.mask(rng.random(data.shape) < 0.01)
+
+
+def _write_KNMI_rows(file, rng, n_rows, columns, period, hourly=False):
+    '''
+    Writes n_rows random KNMI rows in batches. Rows are spread over stations KNMI_FIRST_STATION onwards,
+    each with all days (or hours) of period, so dates remain valid for any number of rows.
+    '''
+
+    days = pd.date_range(*period, freq='D').strftime('%Y%m%d').to_numpy()
+    steps_per_station = len(days) * (24 if hourly else 1)
+    for first in range(0, n_rows, BATCH_SIZE):
+        n = min(BATCH_SIZE, n_rows - first)
+        row = np.arange(first, first + n)
+        step = row % steps_per_station
+        data = _get_KNMI_values(rng, n, columns)
+        if hourly:
+            data.insert(0, 'HH', step % 24 + 1)
+            step = step // 24
+        data.insert(0, 'YYYYMMDD', days[step])
+        data.insert(0, 'STN', row // steps_per_station + KNMI_FIRST_STATION)
+        data.to_csv(file, header=False, index=False)
+
+
+def write_KNMI_daily(path, n_rows, seed=0):
+    '''
+    Writes a synthetic daily KNMI station file with n_rows days, in the format of the KNMI daily data service.
+    '''
+
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as file:
+        file.write('# BRON: KONINKLIJK NEDERLANDS METEOROLOGISCH INSTITUUT (KNMI)\n')
+        file.write('# SOURCE: ROYAL NETHERLANDS METEOROLOGICAL INSTITUTE (KNMI)\n')
+        file.write('# \n')
+        file.write('# YYYYMMDD  = Datum (YYYY=jaar MM=maand DD=dag) / Date (YYYY=year MM=month DD=day)\n')
+        for column in KNMI_DAILY_COLUMNS:
+            file.write('# ' + column.ljust(9) + ' = Parameter ' + column + ' / Parameter ' + column + '\n')
+        file.write('# \n')
+        file.write('# STN,' + ','.join(['YYYYMMDD'] + KNMI_DAILY_COLUMNS) + '\n')
+        file.write('\n')
+        _write_KNMI_rows(file, rng, n_rows, KNMI_DAILY_COLUMNS, KNMI_DAILY_PERIOD)
+    return path
+
+
+def write_KNMI_hourly(path, n_rows, seed=0):
+    '''
+    Writes a synthetic hourly KNMI station file with n_rows hours, in the format of the KNMI hourly data service.
+    '''
+
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as file:
+        file.write('# BRON: KONINKLIJK NEDERLANDS METEOROLOGISCH INSTITUUT (KNMI)\n')
+        file.write('# SOURCE: ROYAL NETHERLANDS METEOROLOGICAL INSTITUTE (KNMI)\n')
+        file.write('# \n')
+        file.write('# STN         LON(east)   LAT(north)     ALT(m)  NAME\n')
+        file.write('# 260:         5.180       52.100       1.90  De Bilt\n')
+        file.write('# \n')
+        file.write('# YYYYMMDD = datum (YYYY=jaar,MM=maand,DD=dag);\n')
+        file.write('# HH       = tijd (HH=uur, UT.12 UT=13 MET, 14 MEZT. Uurvak 05 loopt van 04.00 UT tot 5.00 UT;\n')
+        for column in KNMI_HOURLY_COLUMNS:
+            file.write('# ' + column.ljust(8) + ' = Parameter ' + column + ';\n')
+        file.write('# \n')
+        file.write('# STN,' + ','.join(['YYYYMMDD', 'HH'] + KNMI_HOURLY_COLUMNS) + '\n')
+        file.write('# \n')
+        _write_KNMI_rows(file, rng, n_rows, KNMI_HOURLY_COLUMNS, KNMI_HOURLY_PERIOD, hourly=True)
+    return path
+
+
+def generate_all(data_dir, scale, seed=0):
+    '''
+    Writes all synthetic files of a scale to data_dir, unless they exist already.
+    Returns a dictionary with the paths of all generated files, and a dictionary with the error of each file
+    that could not be generated (e.g. imod is not installed).
+    '''
+
+    os.makedirs(data_dir, exist_ok=True)
+    generators = {'iff': (write_iff, '.iff'),
+                  'ipf': (write_ipf, '.ipf'),
+                  'idf': (write_idf, '.idf'),
+                  'KNMI_daily': (write_KNMI_daily, '.txt'),
+                  'KNMI_hourly': (write_KNMI_hourly, '.txt')}
+    paths = {}
+    errors = {}
+    for name, (generator, extension) in generators.items():
+        path = os.path.join(data_dir, name + '_' + str(scale) + '_' + str(seed) + extension)
+        if not os.path.exists(path):
+            try:
+                generator(path, scale, seed=seed)
+            except Exception as error:
+                ## Remove a partially written file, so it is not used by a next run.
+                if os.path.exists(path):
+                    os.remove(path)
+                errors[name] = type(error).__name__ + ': ' + str(error).split('\n')[0]
+                print('Skipping generation of', path + ':', errors[name])
+                continue
+        paths[name] = path
+    return paths, errors
@@ -0,0 +1,180 @@
+'''
+Benchmark suite of the pyhydro readers and transforms.
+
+Synthetic data is generated per scale (number of rows) with generate_data.py, after which the wall time
+and peak memory of each benchmark are measured. Results are saved as JSON, named after the current commit,
+so they can be compared across commits with compare_benchmarks.py.
+
+Usage:
+    python benchmarks/run_benchmarks.py --scales 10000 100000
+    python benchmarks/run_benchmarks.py --scales 1000000 --benchmarks import_iff cutoff_flowpath
+'''
+
+import argparse
+import datetime as dt
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import generate_data
+import pyhydro
+from tests.test_import import IMPORT_BUDGET, get_import_time
+
+#%%
+def _get_iff(inputs):
+    if 'iff_data' not in inputs:
+        inputs['iff_data'] = pyhydro.import_iff(inputs['paths']['iff'])
+    return inputs['iff_data']
+
+
+def _get_ipf(inputs):
+    if 'ipf_data' not in inputs:
+        inputs['ipf_data'] = pyhydro.import_ipf(inputs['paths']['ipf'])
+    return inputs['ipf_data']
+
+
+## Each benchmark is a function of the inputs of a scale, returning the number of processed rows.
+BENCHMARKS = {
+    'import_iff': lambda inputs: len(pyhydro.import_iff(inputs['paths']['iff'])),
+    'import_iff_parallel': lambda inputs: len(pyhydro.import_iff(inputs['paths']['iff'], n_jobs=-1)),
+    'extract_endpointwell': lambda inputs: len(pyhydro.extract_endpointwell(_get_iff(inputs), generate_data.get_well_cells())),
+    'cutoff_flowpath': lambda inputs: len(pyhydro.cutoff_flowpath(_get_iff(inputs), tmax=10, layer=1)),
+    'get_geometry': lambda inputs: len(pyhydro.get_geometry(_get_iff(inputs), line_type='single_line')),
+    'pipeline_extract_cutoff': lambda inputs: len(pyhydro.scan_iff(inputs['paths']['iff']).extract_endpointwell(generate_data.get_well_cells())
+                                                  .cutoff_flowpath(tmax=10, layer=1).collect()),
+    'import_ipf': lambda inputs: len(pyhydro.import_ipf(inputs['paths']['ipf'])[0]),
+    'flowpath_origin': lambda inputs: len(pyhydro.flowpath_origin(generate_data.get_wells(), *_get_ipf(inputs))[2]),
+    'import_idf': lambda inputs: pyhydro.import_idf(inputs['paths']['idf'])[0].size,
+    'Import_KNMIstation_daily': lambda inputs: len(pyhydro.Import_KNMIstation_daily(inputs['paths']['KNMI_daily'])[1]),
+    'Import_KNMIstation_hourly': lambda inputs: len(pyhydro.Import_KNMIstation_hourly(inputs['paths']['KNMI_hourly'])[2]),
+    }
+
+## Synthetic file required by each benchmark.
+BENCHMARK_DATA = {
+    'import_iff': 'iff',
+    'import_iff_parallel': 'iff',
+    'extract_endpointwell': 'iff',
+    'cutoff_flowpath': 'iff',
+    'get_geometry': 'iff',
+    'pipeline_extract_cutoff': 'iff',
+    'import_ipf': 'ipf',
+    'flowpath_origin': 'ipf',
+    'import_idf': 'idf',
+    'Import_KNMIstation_daily': 'KNMI_daily',
+    'Import_KNMIstation_hourly': 'KNMI_hourly',
+    }
+
+
+def run_benchmark(name, inputs, repeat=1):
+    '''
+    Runs a single benchmark. The wall time is the minimum of repeat runs, the peak memory is measured
+    in a separate run with tracemalloc, so tracing does not affect the wall time.
+    '''
+
+    benchmark = BENCHMARKS[name]
+    if BENCHMARK_DATA[name] not in inputs['paths']:
+        error = inputs['errors'].get(BENCHMARK_DATA[name], 'no synthetic ' + BENCHMARK_DATA[name] + ' data')
+        return {'benchmark': name, 'status': 'skipped', 'error': error}
+    try:
+        times = []
+        for i in range(repeat):
+            gc.collect()
+            t = time.perf_counter()
+            rows = benchmark(inputs)
+            times.append(time.perf_counter() - t)
+
+        gc.collect()
+        tracemalloc.start()
+        benchmark(inputs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    except Exception as error:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return {'benchmark': name, 'status': 'error', 'error': type(error).__name__ + ': ' + str(error).split('\n')[0]}
+
+    wall_time = min(times)
+    return {'benchmark': name,
+            'status': 'ok',
+            'rows': int(rows),
+            'wall_time_s': wall_time,
+            'rows_per_s': rows / wall_time if wall_time > 0 else None,
+            'peak_memory_mb': peak / 1024**2}
+
+
+def get_commit():
+    '''
+    Returns the short hash of the current commit, with suffix "-dirty" for uncommitted changes.
+    '''
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=BENCHMARK_DIR, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, cwd=BENCHMARK_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + '-dirty' if status else commit
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run the pyhydro benchmark suite.')
+    parser.add_argument('--scales', nargs='+', type=float, default=[1e4, 1e5],
+                        help='Number of rows of the synthetic data, e.g. 1e4 1e6 1e8. The default is 1e4 1e5.')
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS),
+                        help='Benchmarks to run. The default is all benchmarks.')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of timed runs of each benchmark. The default is 1.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data. The default is 0.')
+    parser.add_argument('--data-dir', default=os.path.join(BENCHMARK_DIR, 'data'), help='Directory of the synthetic data.')
+    parser.add_argument('--output-dir', default=os.path.join(BENCHMARK_DIR, 'results'), help='Directory of the results.')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET,
+                        help='Maximum wall time in seconds of "import pyhydro". The default is ' + str(IMPORT_BUDGET) + '.')
+    args = parser.parse_args(args)
+
+    results = {'commit': get_commit(),
+               'date': dt.datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(),
+               'numpy': np.__version__,
+               'pandas': pd.__version__,
+               'platform': platform.platform(),
+               'results': []}
+
+    ## Import time of pyhydro, which should not load heavy dependencies, see tests/test_import.py.
+    import_time, heavy_modules = get_import_time()
+    import_ok = (import_time <= args.import_budget) and not heavy_modules
+    results['import'] = {'wall_time_s': import_time, 'budget_s': args.import_budget, 'heavy_modules': heavy_modules, 'status': 'ok' if import_ok else 'over budget'}
+    print('import pyhydro:', round(import_time, 4), 's', '(budget ' + str(args.import_budget) + ' s)', ', '.join(heavy_modules))
+
+    for scale in args.scales:
+        scale = int(scale)
+        print('Generating synthetic data with', scale, 'rows')
+        paths, errors = generate_data.generate_all(args.data_dir, scale, seed=args.seed)
+        inputs = {'paths': paths, 'errors': errors}
+        for name in args.benchmarks:
+            result = run_benchmark(name, inputs, repeat=args.repeat)
+            result['scale'] = scale
+            results['results'].append(result)
+            if result['status'] == 'ok':
+                print('   ', name.ljust(28), str(round(result['wall_time_s'], 4)).rjust(10), 's', str(round(result['peak_memory_mb'], 1)).rjust(10), 'MB')
+            else:
+                print('   ', name.ljust(28), result['error'])
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path_output = os.path.join(args.output_dir, results['commit'] + '_' + dt.datetime.now().strftime('%Y%m%d%H%M%S') + '.json')
+    with open(path_output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print('Benchmark results saved to', path_output)
+    return 0 if import_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
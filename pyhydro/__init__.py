@@ -1,5 +1,68 @@
-from .iff import *
-from .ipf import *
-from .idf import *
-from .import_KNMI import *
-from .write import *
+import importlib
+
+#%%
+## Submodules and their functions are imported on first use, so that heavy dependencies
+## (imod, geopandas, shapely, gdal) are only loaded when a function that needs them is called.
+_submodule_attributes = {
+    'iff': ['import_iff',
+            'import_iff_chunks',
+            'extract_endpointwell',
+            'get_endpoint_well',
+            'get_cell_visitation',
+            'simplify_flowpath',
+            'invert_flowpath',
+            'cutoff_flowpath',
+            'get_geometry',
+            'dissolve_geometry',
+            'get_convexhull'],
+    'flowpath_index': ['build_flowpath_index',
+                       'load_flowpath_index',
+                       'FlowpathIndex'],
+    'pipeline': ['scan_iff',
+                 'FlowpathPipeline'],
+    'ipf': ['import_ipf',
+            'get_well_cells',
+            'flowpath_origin'],
+    'idf': ['import_idf'],
+    'import_KNMI': ['Import_KNMIstation_daily',
+                    'conv_KNMIdata_daily',
+                    'get_relevantKNMIdata_daily',
+                    'Import_KNMIstation_hourly',
+                    'conv_KNMIdata_hourly',
+                    'get_relevantKNMIdata_hourly',
+                    'stack_KNMIdata',
+                    'resample_KNMIdata',
+                    'get_precipitation_surplus',
+                    'get_rolling_KNMIdata',
+                    'get_nearest_KNMIstation',
+                    'get_well_KNMIdata'],
+    'interpolate': ['clear_interpolation_cache',
+                    'get_interpolation_weights',
+                    'iter_interpolated_KNMIdata',
+                    'interpolate_KNMIdata',
+                    'save_interpolated_idf'],
+    'write': ['save_ipf_as_tif'],
+    'schema': ['apply_schema',
+               'memory_report'],
+    'profiling': ['Profiler',
+                  'add_hook',
+                  'remove_hook'],
+    }
+_attribute_submodule = {attribute: submodule for submodule, attributes in _submodule_attributes.items() for attribute in attributes}
+
+__all__ = list(_attribute_submodule)
+
+
+def __getattr__(name):
+    if name in _submodule_attributes:
+        return importlib.import_module('.' + name, __name__)
+    if name in _attribute_submodule:
+        submodule = importlib.import_module('.' + _attribute_submodule[name], __name__)
+        attribute = getattr(submodule, name)
+        globals()[name] = attribute
+        return attribute
+    raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodule_attributes) | set(_attribute_submodule))
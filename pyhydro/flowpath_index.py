@@ -0,0 +1,438 @@
+import numpy as np
+import pandas as pd
+
+from .iff import get_endpoint_well
+from .profiling import profiled
+
+#%%
+def _expand_ranges(starts, counts):
+    '''
+    Returns for ranges [start, start+count) the range number and value of all elements, as two flat arrays.
+    '''
+
+    range_nr = np.repeat(np.arange(len(counts)), counts)
+    values = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    return range_nr, values
+
+
+def _get_min_per_run(key, values):
+    '''
+    Returns the key and minimum value of each run of equal consecutive keys.
+    '''
+
+    if len(key) == 0:
+        return key, values
+    run = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    return key[run], np.minimum.reduceat(values, run)
+
+
+def _get_entry_circle(x0, y0, x1, y1, cx, cy, radius):
+    '''
+    Returns the parameter s [0, 1] at which segments first enter circles, or NaN if they do not.
+    '''
+
+    dx, dy = x1 - x0, y1 - y0
+    fx, fy = x0 - cx, y0 - cy
+    a = dx**2 + dy**2
+    b = 2 * (dx * fx + dy * fy)
+    c = fx**2 + fy**2 - radius**2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s = (-b - np.sqrt(b**2 - 4 * a * c)) / (2 * a)
+    s = np.where((s >= 0) & (s <= 1), s, np.nan)
+    return np.where(c <= 0, 0., s)
+
+
+def _get_entry_bbox(x0, y0, x1, y1, xmin, ymin, xmax, ymax):
+    '''
+    Returns the parameter s [0, 1] at which segments first enter boxes (Liang-Barsky clipping), or NaN if they do not.
+    '''
+
+    s_enter = np.zeros(len(x0))
+    s_exit = np.ones(len(x0))
+    for p0, d, pmin, pmax in [(x0, x1 - x0, xmin, xmax), (y0, y1 - y0, ymin, ymax)]:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s_min = (pmin - p0) / d
+            s_max = (pmax - p0) / d
+        parallel = d == 0
+        s_near = np.where(parallel, np.where((p0 >= pmin) & (p0 <= pmax), -np.inf, np.inf), np.minimum(s_min, s_max))
+        s_far = np.where(parallel, np.where((p0 >= pmin) & (p0 <= pmax), np.inf, -np.inf), np.maximum(s_min, s_max))
+        s_enter = np.maximum(s_enter, s_near)
+        s_exit = np.minimum(s_exit, s_far)
+    return np.where(s_enter <= s_exit, s_enter, np.nan)
+
+
+def _get_polygon_edges(polygon):
+    '''
+    Returns all edges (x0, y0, x1, y1) of the exterior and interior rings of a polygon.
+    The polygon is either a shapely Polygon or an array of exterior coordinates.
+    '''
+
+    if hasattr(polygon, 'exterior'):
+        rings = [np.asarray(polygon.exterior.coords)] + [np.asarray(interior.coords) for interior in polygon.interiors]
+    else:
+        rings = [np.asarray(polygon, dtype=float)]
+    edges = []
+    for ring in rings:
+        ring = ring[:, :2]
+        if not np.array_equal(ring[0], ring[-1]):
+            ring = np.vstack([ring, ring[:1]])
+        edges.append(np.column_stack([ring[:-1], ring[1:]]))
+    return np.vstack(edges)
+
+
+def _get_polygon_slabs(edges, edge_offsets):
+    '''
+    Divides the y-range of each polygon in horizontal slabs, as many as its edges, and stores the edges overlapping
+    each slab in CSR layout. Slab k of polygon p is slab edge_offsets[p] + k. The edges of slab k start at
+    slab_offsets[2 * k], of which the edges starting in the slab (their lowest slab) at slab_offsets[2 * k + 1].
+    Returns the y-range (ymin, ymax) and slab height of each polygon, and the offsets and edges of all slabs.
+    '''
+
+    nedges = np.diff(edge_offsets)
+    edge_polygon = np.repeat(np.arange(len(nedges)), nedges)
+    eymin = np.minimum(edges[:, 1], edges[:, 3])
+    eymax = np.maximum(edges[:, 1], edges[:, 3])
+    ymin = np.minimum.reduceat(eymin, edge_offsets[:-1])
+    ymax = np.maximum.reduceat(eymax, edge_offsets[:-1])
+    height = np.maximum((ymax - ymin) / nedges, 1e-9)
+
+    k0 = np.clip((eymin - ymin[edge_polygon]) // height[edge_polygon], 0, nedges[edge_polygon] - 1).astype(np.int64)
+    k1 = np.clip((eymax - ymin[edge_polygon]) // height[edge_polygon], 0, nedges[edge_polygon] - 1).astype(np.int64)
+    edge, local = _expand_ranges(np.zeros(len(edges), dtype=np.int64), k1 - k0 + 1)
+    group = 2 * (edge_offsets[edge_polygon[edge]] + k0[edge] + local) + (local == 0)
+    order = np.argsort(group, kind='stable')
+    slab_offsets = np.r_[0, np.cumsum(np.bincount(group, minlength=2 * len(edges)))]
+    return ymin, ymax, height, slab_offsets, edge[order]
+
+
+def _get_entry_polygon(x0, y0, x1, y1, polygon, edges, edge_offsets, chunksize=1000000):
+    '''
+    Returns the parameter s [0, 1] at which segments first enter their polygon, or NaN if they do not.
+    Segment i is tested against polygon[i], of which the edges are edges[edge_offsets[polygon[i]]:edge_offsets[polygon[i] + 1]].
+    Segments starting within the polygon (even-odd rule) enter at s=0. Only edges in the slabs (see _get_polygon_slabs)
+    overlapping a segment are tested.
+    '''
+
+    ymin, ymax, height, slab_offsets, slab_edges = _get_polygon_slabs(edges, edge_offsets)
+    ## Coordinates of the edges in slab order.
+    slab_x0, slab_y0, slab_x1, slab_y1 = (np.ascontiguousarray(edges[slab_edges, i]) for i in range(4))
+    nedges = np.diff(edge_offsets)
+    s = np.full(len(x0), np.nan)
+    for start in range(0, len(x0), chunksize):
+        px0, py0, px1, py1 = x0[start:start+chunksize], y0[start:start+chunksize], x1[start:start+chunksize], y1[start:start+chunksize]
+        p = polygon[start:start+chunksize]
+        n = len(p)
+
+        ## Start point within polygon, by counting crossings of a ray in positive x-direction,
+        ## with the edges in the slab of the start point.
+        slab = edge_offsets[p] + np.clip((py0 - ymin[p]) // height[p], 0, nedges[p] - 1).astype(np.int64)
+        counts = np.where((py0 >= ymin[p]) & (py0 <= ymax[p]), slab_offsets[2 * slab + 2] - slab_offsets[2 * slab], 0)
+        pair, position = _expand_ranges(slab_offsets[2 * slab], counts)
+        ex0, ey0, ex1, ey1 = slab_x0[position], slab_y0[position], slab_x1[position], slab_y1[position]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            crosses = ((ey0 > py0[pair]) != (ey1 > py0[pair])) & (px0[pair] < ex0 + (py0[pair] - ey0) * (ex1 - ex0) / (ey1 - ey0))
+        inside = np.bincount(pair, weights=crosses, minlength=n) % 2 == 1
+
+        ## Intersection of segments starting outside, with the edges in all slabs overlapping the segment. Edges in several
+        ## of these slabs are only tested in the first: further slabs only add the edges starting in the slab.
+        sy0, sy1 = np.minimum(py0, py1), np.maximum(py0, py1)
+        k0 = np.clip((sy0 - ymin[p]) // height[p], 0, nedges[p] - 1).astype(np.int64)
+        k1 = np.clip((sy1 - ymin[p]) // height[p], 0, nedges[p] - 1).astype(np.int64)
+        counts = np.where(~inside & (sy1 >= ymin[p]) & (sy0 <= ymax[p]), k1 - k0 + 1, 0)
+        pair, local = _expand_ranges(np.zeros(n, dtype=np.int64), counts)
+        slab = edge_offsets[p[pair]] + k0[pair] + local
+        starts = slab_offsets[2 * slab + (local > 0)]
+        element, position = _expand_ranges(starts, slab_offsets[2 * slab + 2] - starts)
+        pair = pair[element]
+        ex0, ey0, ex1, ey1 = slab_x0[position], slab_y0[position], slab_x1[position], slab_y1[position]
+        qx0, qy0 = px0[pair], py0[pair]
+        dx, dy = px1[pair] - qx0, py1[pair] - qy0
+        ex, ey = ex1 - ex0, ey1 - ey0
+        denominator = dx * ey - dy * ex
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s_segment = ((ex0 - qx0) * ey - (ey0 - qy0) * ex) / denominator
+            s_edge = ((ex0 - qx0) * dy - (ey0 - qy0) * dx) / denominator
+        hit = (denominator != 0) & (s_segment >= 0) & (s_segment <= 1) & (s_edge >= 0) & (s_edge <= 1)
+        s_chunk = np.full(n, np.inf)
+        np.minimum.at(s_chunk, pair[hit], s_segment[hit])
+        s_chunk = np.where(np.isinf(s_chunk), np.nan, s_chunk)
+        s[start:start+chunksize] = np.where(inside, 0., s_chunk)
+    return s
+
+
+class FlowpathIndex:
+    '''
+    Spatial index over the segments of flowpaths, to find flowpaths (and wells) passing within a distance of points,
+    through boxes or through polygons. Segments are stored in buckets of a regular grid over their XY-extents.
+    Build the index with build_flowpath_index, or load a saved index with load_flowpath_index.
+    '''
+
+    _arrays = ['x0', 'y0', 'x1', 'y1', 't0', 't1', 'segment_particle', 'particles', 'particle_t_end',
+               'particle_well', 'well_codes', 'bucket_offsets', 'bucket_segments', 'grid']
+
+    def __init__(self, **arrays):
+        for name in self._arrays:
+            setattr(self, name, arrays[name])
+        self.xmin, self.ymin, self.cell_size, self.nx, self.ny = self.grid
+        self.nx, self.ny = int(self.nx), int(self.ny)
+
+    def __len__(self):
+        return len(self.x0)
+
+    def _get_candidates(self, qxmin, qymin, qxmax, qymax):
+        '''
+        Returns unique (query, segment) pairs of all segments in buckets overlapping the query boxes.
+        '''
+
+        ix0 = np.clip((qxmin - self.xmin) // self.cell_size, 0, self.nx - 1).astype(np.int64)
+        ix1 = np.clip((qxmax - self.xmin) // self.cell_size, 0, self.nx - 1).astype(np.int64)
+        iy0 = np.clip((qymin - self.ymin) // self.cell_size, 0, self.ny - 1).astype(np.int64)
+        iy1 = np.clip((qymax - self.ymin) // self.cell_size, 0, self.ny - 1).astype(np.int64)
+        outside = (qxmax < self.xmin) | (qymax < self.ymin) | (qxmin > self.xmin + self.nx * self.cell_size) | (qymin > self.ymin + self.ny * self.cell_size)
+
+        ## Expand query boxes to buckets.
+        nx_query = ix1 - ix0 + 1
+        counts = np.where(outside, 0, nx_query * (iy1 - iy0 + 1))
+        query, local = _expand_ranges(np.zeros(len(counts), dtype=np.int64), counts)
+        first_column = local % nx_query[query] == 0
+        first_row = local < nx_query[query]
+        bucket = (iy0[query] + local // nx_query[query]) * self.nx + ix0[query] + local % nx_query[query]
+
+        ## Segments are stored in all buckets overlapping their extent, grouped per bucket (see build_flowpath_index).
+        ## Each pair is found only in the bucket of the lower left corner of the overlap of the boxes of query and
+        ## segment: the first column or row of the query includes segments starting in an earlier column or row.
+        group_start = np.where(first_column, 0, 1)
+        group_end = np.where(first_column & first_row, 4, np.where(first_row, 3, 2))
+        starts = self.bucket_offsets[4 * bucket + group_start]
+        pair, position = _expand_ranges(starts, self.bucket_offsets[4 * bucket + group_end] - starts)
+        return query[pair], self.bucket_segments[position]
+
+    def _get_result(self, query, segment, s):
+        '''
+        Returns the first entry of each particle per query, with entry time, remaining travel time and well.
+        '''
+
+        hit = ~np.isnan(s)
+        query, segment, s = query[hit], segment[hit], s[hit]
+        t_entry = self.t0[segment] + s * (self.t1[segment] - self.t0[segment])
+        key = query * len(self.particles) + self.segment_particle[segment]
+
+        ## Reduce to the first entry per query and particle. Segments of a particle are mostly found consecutively,
+        ## so runs of equal keys are reduced first, before sorting the remaining keys.
+        key, t_entry = _get_min_per_run(key, t_entry)
+        order = np.argsort(key, kind='stable')
+        key, t_entry = _get_min_per_run(key[order], t_entry[order])
+        query, particle = key // len(self.particles), key % len(self.particles)
+
+        well_nr = self.particle_well[particle]
+        result = pd.DataFrame({'Query': query,
+                               'PARTICLE_NUMBER': self.particles[particle],
+                               'T_entry': t_entry,
+                               'T_to_well': self.particle_t_end[particle] - t_entry,
+                               'Well_nr': well_nr})
+        result.loc[:, 'Well_code'] = np.where(well_nr >= 0, self.well_codes[np.maximum(well_nr, 0)], None) if len(self.well_codes) > 0 else None
+        return result
+
+    @profiled(rows=len)
+    def query_radius(self, xs, ys, radius):
+        '''
+        Find all flowpaths passing within radius of points.
+
+
+        Parameters
+        ----------
+        xs : array
+            x-coordinates of points, e.g. spill locations.
+        ys : array
+            y-coordinates of points.
+        radius : float or array
+            Search radius of each point.
+
+        Returns
+        -------
+        result : pd.DataFrame
+            Dataframe with one row per point (Query, position in xs) and flowpath (PARTICLE_NUMBER), with the travel time at which
+            the flowpath first enters the radius (T_entry), the remaining travel time to the endpoint (T_to_well),
+            and the well in which the flowpath ends (Well_nr and Well_code, -1 and None if not captured by a well).
+        '''
+
+        xs, ys = np.atleast_1d(np.asarray(xs, dtype=float)), np.atleast_1d(np.asarray(ys, dtype=float))
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), xs.shape)
+        query, segment = self._get_candidates(xs - radius, ys - radius, xs + radius, ys + radius)
+        s = _get_entry_circle(self.x0[segment], self.y0[segment], self.x1[segment], self.y1[segment], xs[query], ys[query], radius[query])
+        return self._get_result(query, segment, s)
+
+    @profiled(rows=len)
+    def query_bbox(self, xmin, ymin, xmax, ymax):
+        '''
+        Find all flowpaths passing through boxes.
+
+
+        Parameters
+        ----------
+        xmin, ymin, xmax, ymax : array
+            Coordinates of lower left and upper right corners of boxes.
+
+        Returns
+        -------
+        result : pd.DataFrame
+            Dataframe with one row per box (Query) and flowpath, see query_radius.
+        '''
+
+        xmin, ymin, xmax, ymax = [np.atleast_1d(np.asarray(value, dtype=float)) for value in (xmin, ymin, xmax, ymax)]
+        query, segment = self._get_candidates(xmin, ymin, xmax, ymax)
+        s = _get_entry_bbox(self.x0[segment], self.y0[segment], self.x1[segment], self.y1[segment],
+                            xmin[query], ymin[query], xmax[query], ymax[query])
+        return self._get_result(query, segment, s)
+
+    @profiled(rows=len)
+    def query_polygon(self, polygons):
+        '''
+        Find all flowpaths crossing polygons, e.g. landfills or industrial sites.
+
+
+        Parameters
+        ----------
+        polygons : list
+            List of shapely Polygons or arrays with exterior coordinates. A single polygon is accepted as well.
+
+        Returns
+        -------
+        result : pd.DataFrame
+            Dataframe with one row per polygon (Query) and flowpath, see query_radius.
+        '''
+
+        if hasattr(polygons, 'exterior') or (isinstance(polygons, np.ndarray) and polygons.ndim == 2):
+            polygons = [polygons]
+        if len(polygons) == 0:
+            return self._get_result(np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([]))
+
+        ## Edges of all polygons, stored consecutively per polygon, and the bounding box of each polygon.
+        edges = [_get_polygon_edges(polygon) for polygon in polygons]
+        edge_offsets = np.r_[0, np.cumsum([len(polygon_edges) for polygon_edges in edges])]
+        edges = np.vstack(edges)
+        xmin = np.minimum.reduceat(np.minimum(edges[:, 0], edges[:, 2]), edge_offsets[:-1])
+        ymin = np.minimum.reduceat(np.minimum(edges[:, 1], edges[:, 3]), edge_offsets[:-1])
+        xmax = np.maximum.reduceat(np.maximum(edges[:, 0], edges[:, 2]), edge_offsets[:-1])
+        ymax = np.maximum.reduceat(np.maximum(edges[:, 1], edges[:, 3]), edge_offsets[:-1])
+
+        ## Test all candidate segments of all polygons at once.
+        query, segment = self._get_candidates(xmin, ymin, xmax, ymax)
+        s = _get_entry_polygon(self.x0[segment], self.y0[segment], self.x1[segment], self.y1[segment], query, edges, edge_offsets)
+        return self._get_result(query, segment, s)
+
+    def save(self, path):
+        '''
+        Save index to a .npz file, to load it later with load_flowpath_index.
+        '''
+
+        np.savez(path, **{name: getattr(self, name) for name in self._arrays})
+
+
+@profiled(rows=len)
+def build_flowpath_index(data, wells=None, cell_size=None, report=False):
+    '''
+    Build a spatial index over the segments of imported flowpath data.
+
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame with imported .iff flowpath data
+    wells : pd.DataFrame
+        Optional dataframe containing the wells, with columns "IROW" and "ICOL" (see get_well_cells),
+        used to find the well in which each flowpath ends. The default is None.
+    cell_size : float
+        Size of the buckets of the index. The default is None, which derives a size with on average
+        about 16 segments per bucket. As each segment is found only once per query, query time depends little
+        on the cell size, also for queries much larger than the buckets.
+    report : bool
+        boolean to print progress report of function. Either True or False. The default is False.
+
+    Returns
+    -------
+    index : FlowpathIndex
+        Spatial index over the flowpath segments, with methods query_radius, query_bbox, query_polygon and save.
+    '''
+
+    if report:
+        print('Building spatial index of flowpath segments.')
+    endpoints = get_endpoint_well(data, wells)
+
+    ## Derive segments between consecutive points of each particle, ordered by time.
+    particle = data.loc[:, 'PARTICLE_NUMBER'].values
+    time = data.loc[:, 'TIME(YEARS)'].values.astype(float)
+    order = np.lexsort((time, particle))
+    particle, time = particle[order], time[order]
+    x = data.loc[:, 'XCRD.'].values.astype(float)[order]
+    y = data.loc[:, 'YCRD.'].values.astype(float)[order]
+    segment = np.flatnonzero(particle[1:] == particle[:-1])
+    x0, y0, x1, y1 = x[segment], y[segment], x[segment + 1], y[segment + 1]
+    t0, t1 = time[segment], time[segment + 1]
+    segment_particle = np.searchsorted(endpoints.loc[:, 'PARTICLE_NUMBER'].values, particle[segment])
+
+    ## Bucket grid over the extent of all segments.
+    xmin, ymin = min(x0.min(), x1.min()), min(y0.min(), y1.min())
+    xmax, ymax = max(x0.max(), x1.max()), max(y0.max(), y1.max())
+    if cell_size is None:
+        cell_size = max(np.sqrt((xmax - xmin) * (ymax - ymin) * 16 / len(x0)), np.median(np.hypot(x1 - x0, y1 - y0)), 1e-6)
+    nx = int((xmax - xmin) // cell_size) + 1
+    ny = int((ymax - ymin) // cell_size) + 1
+
+    ## Store each segment in all buckets overlapping its extent, in CSR layout. The segments of each bucket are grouped by
+    ## whether the bucket is in the first column and/or row of the segment: 0 first row only, 1 both, 2 first column only,
+    ## 3 neither. Group g of bucket b starts at bucket_offsets[4 * b + g], see FlowpathIndex._get_candidates.
+    ix0 = ((np.minimum(x0, x1) - xmin) // cell_size).astype(np.int64)
+    ix1 = ((np.maximum(x0, x1) - xmin) // cell_size).astype(np.int64)
+    iy0 = ((np.minimum(y0, y1) - ymin) // cell_size).astype(np.int64)
+    iy1 = ((np.maximum(y0, y1) - ymin) // cell_size).astype(np.int64)
+    ## Order segments by the bucket of their lower left corner, so segments in the same buckets are stored close together.
+    order = np.argsort(iy0 * nx + ix0, kind='stable')
+    x0, y0, x1, y1, t0, t1, segment_particle = x0[order], y0[order], x1[order], y1[order], t0[order], t1[order], segment_particle[order]
+    ix0, ix1, iy0, iy1 = ix0[order], ix1[order], iy0[order], iy1[order]
+    nx_segment = ix1 - ix0 + 1
+    segment_nr, local = _expand_ranges(np.zeros(len(x0), dtype=np.int64), nx_segment * (iy1 - iy0 + 1))
+    bucket = (iy0[segment_nr] + local // nx_segment[segment_nr]) * nx + ix0[segment_nr] + local % nx_segment[segment_nr]
+    first_column = local % nx_segment[segment_nr] == 0
+    first_row = local < nx_segment[segment_nr]
+    group = 4 * bucket + np.select([first_row & ~first_column, first_row & first_column, first_column], [0, 1, 2], 3)
+    order = np.argsort(group, kind='stable')
+    bucket_offsets = np.r_[0, np.cumsum(np.bincount(group, minlength=4 * nx * ny))]
+
+    well_codes = np.array([], dtype=str)
+    if wells is not None and 'Name' in wells.columns:
+        well_codes = wells.loc[:, 'Name'].to_numpy(dtype=str)
+
+    index = FlowpathIndex(x0=x0, y0=y0, x1=x1, y1=y1, t0=t0, t1=t1, segment_particle=segment_particle,
+                          particles=endpoints.loc[:, 'PARTICLE_NUMBER'].values,
+                          particle_t_end=endpoints.loc[:, 'T_end'].values.astype(float),
+                          particle_well=endpoints.loc[:, 'Well_nr'].values.astype(np.int64),
+                          well_codes=well_codes,
+                          bucket_offsets=bucket_offsets, bucket_segments=segment_nr[order],
+                          grid=np.array([xmin, ymin, cell_size, nx, ny]))
+    if report:
+        print('Spatial index built with', str(len(x0)), 'segments in', str(nx), 'x', str(ny), 'buckets.')
+    return index
+
+
+def load_flowpath_index(path):
+    '''
+    Load a spatial index of flowpath segments, saved with FlowpathIndex.save.
+
+
+    Parameters
+    ----------
+    path : str
+        Path to .npz file.
+
+    Returns
+    -------
+    index : FlowpathIndex
+        Spatial index over the flowpath segments.
+    '''
+
+    with np.load(path) as arrays:
+        index = FlowpathIndex(**{name: arrays[name] for name in FlowpathIndex._arrays})
+    if len(index.bucket_offsets) != 4 * index.nx * index.ny + 1:
+        raise ValueError('Index ' + str(path) + ' has no groups of segments per bucket, rebuild it with build_flowpath_index.')
+    return index
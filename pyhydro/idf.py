@@ -1,7 +1,9 @@
-import imod
 import numpy as np
 
+from .profiling import profiled
+
 #%%
+@profiled(rows=lambda result: result[0].size)
 def import_idf(path_idf):
     '''
     Function to import .idf file as a raster. 
@@ -25,6 +27,8 @@ def import_idf(path_idf):
     
     '''
     
+    import imod
+    
     ## Import idf via path
     idf = imod.idf.open_dataset(path_idf)
     idf_key = list(idf.keys())[0]
@@ -38,8 +42,8 @@ def import_idf(path_idf):
     idf_ys = idf_data.y.values
     
     ## Get dx and dy
-    idf_dx = np.float(idf_data.dx.values)
-    idf_dy = np.float(idf_data.dy.values)
+    idf_dx = float(idf_data.dx.values)
+    idf_dy = float(idf_data.dy.values)
     
     ## Get coordinates of extent, and correct at corners using dx and dy.
     ul_idf_x, ul_idf_y = idf_xs[0], idf_ys[0]
@@ -1,11 +1,16 @@
+import io
+import os
+
 import numpy as np
 import pandas as pd
-import geopandas as gpd
-import shapely
+
+from .profiling import profiled, stage
+from .schema import IFF_DTYPES, get_dtypes
 
 #%%
 
-def import_iff(path_iff, report=False):
+@profiled(rows=len)
+def import_iff(path_iff, float32_time=False, n_jobs=1, block_size=64 * 1024**2, report=False):
     '''
     Import data from .iff iMOD flowpath file and return dataframe
     
@@ -14,50 +19,255 @@ def import_iff(path_iff, report=False):
     ----------
     path_iff : str
         Path to .iff file
+    float32_time : bool
+        If True, travel time is stored as float32 instead of float64. The default is False
+    n_jobs : int
+        Number of worker processes parsing the file in parallel. -1 uses all cores. The default is 1, which parses
+        the file in the current process. On Windows, a script using n_jobs other than 1 should call import_iff
+        within an "if __name__ == '__main__':" block.
+    block_size : int
+        Approximate size in bytes of the blocks of the file parsed by a worker at once, if n_jobs is not 1.
+        The default is 64 MB.
     report : bool
         boolean to print progress report. Either True or False. The default is False
 
     Returns
     -------
     data : pd.DataFrame
-        dataframe with flowpath data of imported .iff file
+        dataframe with flowpath data of imported .iff file, in the order of the file. Particle numbers and cell indices are stored as
+        compact integers (see schema.IFF_DTYPES), coordinates as float64.
     '''
     
     
-    ## Open .iff file
-    iff_header = {}
-    iff = open(path_iff, 'r')
+    ## Import header of .iff file
+    columns, nheader = _read_iff_header(path_iff)
     if report:
         print('Importing',path_iff,'to dataframe')
     
-    ## Import header of .iff file
-    # Read number of columns in .iff file
-    ncols = int(iff.readline().strip('\n'))
-
-    # Read column names in .iff file
-    for i in range(ncols):
-        iff_header[i] = iff.readline().strip('\n')
-    
-    ## Import flowpath data of .iff file
-    data = []
-    line = ''
-    while line != '\n':
-        line = iff.readline()
-        if not line:
-            break
-        line = line.strip('\n')
-        lineparts = line.split(' ')
-        lineparts = np.array(lineparts)[np.array([len(part) > 0 for part in lineparts]) == True].astype(np.float)
-        data.append(lineparts)
-    data = pd.DataFrame(data=data, columns=list(iff_header.values()))
-
-    ## Close .iff file
-    iff.close()
+    ## Import flowpath data of .iff file, with compact dtypes.
+    dtypes = get_dtypes(columns, IFF_DTYPES, float32_time=float32_time)
+    if not isinstance(n_jobs, (int, np.integer)) or (n_jobs < 1 and n_jobs != -1):
+        raise ValueError("n_jobs should be a positive integer or -1, not '" + str(n_jobs) + "'")
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if n_jobs == 1:
+        data = pd.read_csv(path_iff, sep=r'\s+', header=None, names=columns, skiprows=nheader, dtype=dtypes)
+    else:
+        data = _import_iff_parallel(path_iff, columns, nheader, dtypes, n_jobs, block_size, report=report)
+
     if report:
         print('iMOD flowpath file .iff imported with',len(data.loc[:, 'PARTICLE_NUMBER'].unique()),'flowpaths.')
     return data
 
 
+def _read_iff_header(path_iff):
+    '''
+    Returns column names of .iff file and number of header lines.
+    '''
+    
+    with open(path_iff, 'r') as iff:
+        ncols = int(iff.readline().strip())
+        columns = [iff.readline().strip() for i in range(ncols)]
+    return columns, ncols + 1
+
+
+def _get_iff_blocks(path_iff, nheader, nblocks):
+    '''
+    Splits the data lines of .iff file in at most nblocks byte ranges (start, end), aligned to the start of lines.
+    '''
+    
+    with open(path_iff, 'rb') as iff:
+        for i in range(nheader):
+            iff.readline()
+        data_start = iff.tell()
+        size = iff.seek(0, os.SEEK_END)
+        bounds = [data_start]
+        for i in range(1, nblocks):
+            position = data_start + (size - data_start) * i // nblocks
+            if position <= bounds[-1]:
+                continue
+            ## Move the bound to the start of the next line.
+            iff.seek(position - 1)
+            iff.readline()
+            bounds.append(iff.tell())
+        bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def _read_iff_block(path_iff, start, end):
+    with open(path_iff, 'rb') as iff:
+        iff.seek(start)
+        return iff.read(end - start)
+
+
+def _count_iff_rows(task):
+    '''
+    Returns the number of lines in a byte range of .iff file. Worker function of _import_iff_parallel.
+    '''
+    
+    path_iff, start, end = task
+    block = _read_iff_block(path_iff, start, end)
+    return block.count(b'\n') + (not block.endswith(b'\n'))
+
+
+def _parse_iff_block(task):
+    '''
+    Parses a byte range of .iff file and writes its rows to the shared memory columns, from row onwards.
+    Returns the number of parsed rows. Worker function of _import_iff_parallel.
+    '''
+    
+    from multiprocessing import shared_memory
+    
+    path_iff, start, end, row, columns, dtypes, shared_names, nrows = task
+    block = _read_iff_block(path_iff, start, end)
+    if not block.strip():
+        return 0
+    data = pd.read_csv(io.BytesIO(block), sep=r'\s+', header=None, names=columns, dtype=dtypes)
+    for column in columns:
+        shared = shared_memory.SharedMemory(name=shared_names[column])
+        values = np.ndarray(nrows, dtype=dtypes[column], buffer=shared.buf)
+        values[row:row + len(data)] = data.loc[:, column].values
+        del values
+        shared.close()
+    return len(data)
+
+
+class _SharedColumn:
+    '''
+    Array interface of a column in shared memory. Arrays created from it keep the shared memory alive as their base.
+    '''
+    
+    def __init__(self, shared, dtype, nrows):
+        self.shared = shared
+        self.__array_interface__ = np.ndarray(nrows, dtype=dtype, buffer=shared.buf).__array_interface__
+
+
+def _import_iff_parallel(path_iff, columns, nheader, dtypes, n_jobs, block_size, report=False):
+    '''
+    Parses the data lines of .iff file with n_jobs worker processes, see import_iff.
+    The file is split in byte ranges aligned to lines. Workers first count the rows of each range, after which
+    each range is parsed and written at its row offset to typed columns in shared memory, which keeps the order
+    of the file. Note that counting the rows reads the whole file once more, before it is parsed.
+    The columns of the returned dataframe refer directly to the shared memory, without a copy, and keep it mapped
+    until the dataframe is deleted (on Windows, shared memory exists as long as a handle to it is open).
+    Only if the file contains blank lines, the columns are copied once from shared memory to leave out the blank rows.
+    '''
+    
+    import multiprocessing
+    from multiprocessing import shared_memory
+    
+    nblocks = max(n_jobs, int(np.ceil(os.path.getsize(path_iff) / block_size)))
+    blocks = _get_iff_blocks(path_iff, nheader, nblocks)
+    if report:
+        print('Parsing', str(len(blocks)), 'blocks with', str(n_jobs), 'processes')
+    
+    ## Start the resource tracker of shared memory before the workers, so the workers use it too, instead of
+    ## starting their own tracker that removes the shared memory when a worker ends.
+    if os.name == 'posix':
+        from multiprocessing import resource_tracker
+        resource_tracker.ensure_running()
+    
+    with multiprocessing.Pool(n_jobs) as pool:
+        with stage('iff.count_rows') as count_stage:
+            counts = np.array(pool.map(_count_iff_rows, [(path_iff, start, end) for start, end in blocks]), dtype=np.int64)
+            rows = np.r_[0, np.cumsum(counts)]
+            nrows = int(rows[-1])
+            count_stage.rows = nrows
+        
+        shared = {}
+        try:
+            for column in columns:
+                shared[column] = shared_memory.SharedMemory(create=True, size=max(nrows * np.dtype(dtypes[column]).itemsize, 1))
+            shared_names = {column: shared[column].name for column in columns}
+            with stage('iff.parse_blocks') as parse_stage:
+                tasks = [(path_iff, start, end, int(rows[i]), columns, dtypes, shared_names, nrows) for i, (start, end) in enumerate(blocks)]
+                parsed = np.array(pool.map(_parse_iff_block, tasks), dtype=np.int64)
+                parse_stage.rows = int(parsed.sum())
+            
+            if (parsed == counts).all():
+                ## The names of the shared memory are unlinked (on POSIX systems, unlink does nothing on Windows),
+                ## but the memory remains mapped by the columns until the dataframe is deleted.
+                columns_shared = {}
+                for column in columns:
+                    columns_shared[column] = np.asarray(_SharedColumn(shared[column], dtypes[column], nrows))
+                    shared.pop(column).unlink()
+                data = pd.DataFrame(columns_shared, columns=columns, copy=False)
+            else:
+                ## Blank lines are counted, but not parsed: keep only the rows that are written.
+                keep = np.concatenate([np.arange(row, row + n) for row, n in zip(rows[:-1], parsed)])
+                columns_shared = {column: np.ndarray(nrows, dtype=dtypes[column], buffer=shared[column].buf)[keep] for column in columns}
+                data = pd.DataFrame(columns_shared, columns=columns, copy=False)
+                del columns_shared
+        finally:
+            for column in shared:
+                shared[column].close()
+                shared[column].unlink()
+    return data
+
+
+def import_iff_chunks(path_iff, chunksize=1000000, float32_time=False, report=False):
+    '''
+    Import data from .iff iMOD flowpath file in chunks, to process large files in bounded memory.
+    Each chunk contains complete flowpaths: rows of the last particle of a chunk are moved to the next chunk.
+    Requires that the rows of each particle are stored consecutively, as written by iMOD.
+    
+    
+    Parameters
+    ----------
+    path_iff : str
+        Path to .iff file
+    chunksize : int
+        Approximate number of rows per chunk. The default is 1000000.
+    float32_time : bool
+        If True, travel time is stored as float32 instead of float64. The default is False
+    report : bool
+        boolean to print progress report. Either True or False. The default is False
+
+    Yields
+    ------
+    data : pd.DataFrame
+        dataframe with flowpath data of a chunk of complete flowpaths
+    '''
+    
+    if report:
+        print('Importing', path_iff, 'in chunks of', str(chunksize), 'rows')
+    for start, chunk in _iter_iff_chunks(path_iff, chunksize=chunksize, float32_time=float32_time):
+        yield chunk
+
+
+def _iter_iff_chunks(path_iff, chunksize=1000000, usecols=None, start=0, nrows=None, float32_time=False):
+    '''
+    Yields chunks of complete flowpaths of .iff file, optionally with only the columns usecols and only the
+    nrows rows from line start (counted from the first data line), together with the row number of the first row of each chunk.
+    Note that start counts lines of the file like skiprows of read_csv, while nrows and the row numbers count rows,
+    which exclude blank lines. Without blank lines, both are the same.
+    '''
+    
+    columns, nheader = _read_iff_header(path_iff)
+    dtypes = get_dtypes(columns, IFF_DTYPES, float32_time=float32_time)
+    if usecols is not None:
+        usecols = [column for column in columns if column in usecols]
+        dtypes = {column: dtypes[column] for column in usecols}
+    
+    remainder = None
+    chunk_start = start
+    reader = pd.read_csv(path_iff, sep=r'\s+', header=None, names=columns, usecols=usecols, skiprows=nheader + start,
+                         nrows=nrows, chunksize=chunksize, dtype=dtypes)
+    for chunk in reader:
+        if remainder is not None:
+            chunk = pd.concat([remainder, chunk], ignore_index=True)
+        ## Keep rows of the last particle for the next chunk, as the particle may continue in that chunk.
+        particle = chunk.loc[:, 'PARTICLE_NUMBER'].values
+        last_start = len(particle) - np.argmax(particle[::-1] != particle[-1]) if (particle != particle[-1]).any() else 0
+        remainder = chunk.iloc[last_start:]
+        if last_start > 0:
+            yield chunk_start, chunk.iloc[:last_start]
+            chunk_start += last_start
+    if remainder is not None and len(remainder) > 0:
+        yield chunk_start, remainder
+
+
+@profiled(rows=len)
 def extract_endpointwell(data, well_cells, report=False):
     '''
     Extract all flowpaths which end up at wells. 
@@ -84,25 +294,333 @@ def extract_endpointwell(data, well_cells, report=False):
         print('Starting extraction of flowpaths that end up in wells.')
         print('Provided wells:')
         print('     ',well_cells)
-    particles = []
-    for i, well_cell in enumerate(well_cells):
-        row, col = well_cell
-        particles_endpoint = data.loc[(data.loc[:, 'IROW'] == row) & (data.loc[:, 'ICOL'] == col), 'PARTICLE_NUMBER'].unique()
-        particles.extend(particles_endpoint)
+    ## Select particles passing any of the well cells, comparing all rows with all well cells at once.
+    cells = pd.MultiIndex.from_arrays([data.loc[:, 'IROW'].values, data.loc[:, 'ICOL'].values])
+    in_well = cells.isin([tuple(well_cell) for well_cell in well_cells])
+    particles = data.loc[in_well, 'PARTICLE_NUMBER'].unique()
     
     if report:
         print('Flowpaths extracted.')
         print('Saving extracted flowpaths to DataFrame...')
-    data_output = []
-    for i, particle in enumerate(particles):
-        data_particle = data.loc[data.loc[:, 'PARTICLE_NUMBER'] == particle].values
-        data_output.extend(data_particle)
-    data_output = pd.DataFrame(data=data_output, columns=data.columns)
+    ## Boolean selection keeps the (compact) dtypes of data.
+    data_output = data.loc[data.loc[:, 'PARTICLE_NUMBER'].isin(particles)].reset_index(drop=True)
     if report:
         print('Extracted flowpaths saved to DataFrame.')
     return data_output
 
 
+@profiled(rows=len)
+def get_endpoint_well(data, wells=None, report=False):
+    '''
+    Get start time, end time and endpoint cell of each flowpath, and the well in which the flowpath ends.
+    
+    
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame with imported .iff flowpath data
+    wells : pd.DataFrame
+        Optional dataframe containing the wells, with columns "IROW" and "ICOL" (see get_well_cells),
+        and optionally a column "Name". The default is None.
+    report : bool
+        boolean to print progress report of function. Either True or False. The default is False.
+
+    Returns
+    -------
+    endpoints : pd.DataFrame
+        Dataframe with one row per flowpath, with columns PARTICLE_NUMBER, T_start, T_end, IROW and ICOL of the endpoint,
+        Well_nr (position of the well in wells, -1 if the flowpath does not end in a well) and Well_code (Name of the well).
+    '''
+    
+    if report:
+        print('Deriving endpoints of flowpaths.')
+    ## Sort rows by particle and time, so the first and last row of each particle are its start and endpoint.
+    particle = data.loc[:, 'PARTICLE_NUMBER'].values
+    time = data.loc[:, 'TIME(YEARS)'].values
+    order = np.lexsort((time, particle))
+    particle = particle[order]
+    first = np.flatnonzero(np.r_[True, particle[1:] != particle[:-1]])
+    last = np.r_[first[1:], len(particle)] - 1
+    
+    endpoints = pd.DataFrame({'PARTICLE_NUMBER': particle[first],
+                              'T_start': time[order[first]],
+                              'T_end': time[order[last]],
+                              'IROW': data.loc[:, 'IROW'].values[order[last]],
+                              'ICOL': data.loc[:, 'ICOL'].values[order[last]]})
+    
+    ## Match endpoint cells with well cells.
+    endpoints.loc[:, 'Well_nr'] = -1
+    endpoints.loc[:, 'Well_code'] = None
+    if wells is not None and len(wells) > 0:
+        well_cells = pd.MultiIndex.from_arrays([wells.loc[:, 'IROW'].values.astype(np.int64), wells.loc[:, 'ICOL'].values.astype(np.int64)])
+        endpoint_cells = pd.MultiIndex.from_arrays([endpoints.loc[:, 'IROW'].values.astype(np.int64), endpoints.loc[:, 'ICOL'].values.astype(np.int64)])
+        well_first = ~well_cells.duplicated()
+        well_nr = well_cells[well_first].get_indexer(endpoint_cells)
+        well_nr = np.where(well_nr >= 0, np.flatnonzero(well_first)[well_nr], -1)
+        endpoints.loc[:, 'Well_nr'] = well_nr
+        if 'Name' in wells.columns:
+            endpoints.loc[well_nr >= 0, 'Well_code'] = wells.loc[:, 'Name'].values[well_nr[well_nr >= 0]]
+    if report:
+        print(str((endpoints.loc[:, 'Well_nr'] >= 0).sum()), 'of', str(len(endpoints)), 'flowpaths end in a well.')
+    return endpoints
+
+
+@profiled(rows=lambda result: int(result[0].sum()))
+def get_cell_visitation(data, nlay, nrow, ncol, wells=None, report=False):
+    '''
+    Derive per model cell the number of visiting flowpaths, their minimum and mean travel time, and the dominant well.
+    All rasters are derived with vectorized scatter-adds. Repeated visits of a cell by the same particle are counted once,
+    using the travel time of the first visit.
+    
+    
+    Parameters
+    ----------
+    data : pd.DataFrame or iterable
+        DataFrame with imported .iff flowpath data, or an iterable of DataFrames with complete flowpaths,
+        e.g. import_iff_chunks, to process large .iff files in bounded memory.
+    nlay : int
+        Number of layers of the model.
+    nrow : int
+        Number of rows of the model.
+    ncol : int
+        Number of columns of the model.
+    wells : pd.DataFrame
+        Optional dataframe containing the wells, with columns "IROW" and "ICOL" (see get_well_cells),
+        and optionally a column "Name". Used to derive the dominant well. The default is None.
+    report : bool
+        boolean to print progress report of function. Either True or False. The default is False.
+
+    Returns
+    -------
+    count : array
+        raster (nlay, nrow, ncol) containing the number of flowpaths passing through each cell.
+    traveltime_min : array
+        raster (nlay, nrow, ncol) containing the minimum travel time of flowpaths at each cell. NaN if not visited.
+    traveltime_mean : array
+        raster (nlay, nrow, ncol) containing the mean travel time of flowpaths at each cell. NaN if not visited.
+    dominant_well : array
+        raster (nlay, nrow, ncol) containing the well (position in wells) of most flowpaths passing through each cell.
+        -1 if no flowpath through the cell ends in a well.
+    cell_wells : pd.DataFrame
+        dataframe with the number of flowpaths (count) per cell (ILAY, IROW, ICOL) and well (Well_nr, Well_code),
+        as reverse index from cells to contributing wells.
+    '''
+    
+    if isinstance(data, pd.DataFrame):
+        data = [data]
+    ncells = nlay * nrow * ncol
+    nwells = 0 if wells is None else len(wells)
+    
+    count = np.zeros(ncells, dtype=np.int64)
+    traveltime_sum = np.zeros(ncells)
+    traveltime_min = np.full(ncells, np.inf)
+    pair_keys = np.zeros(0, dtype=np.int64)
+    pair_counts = np.zeros(0, dtype=np.int64)
+    
+    for i, chunk in enumerate(data):
+        if report:
+            print('Deriving cell visitation of chunk', str(i), 'with', str(len(chunk)), 'rows')
+        particle = chunk.loc[:, 'PARTICLE_NUMBER'].values
+        time = chunk.loc[:, 'TIME(YEARS)'].values.astype(float)
+        ilay = chunk.loc[:, 'ILAY'].values.astype(np.int64) - 1
+        irow = chunk.loc[:, 'IROW'].values.astype(np.int64) - 1
+        icol = chunk.loc[:, 'ICOL'].values.astype(np.int64) - 1
+        inside = (ilay >= 0) & (ilay < nlay) & (irow >= 0) & (irow < nrow) & (icol >= 0) & (icol < ncol)
+        cell = (ilay * nrow + irow) * ncol + icol
+        
+        ## Keep the first visit of each particle in each cell.
+        particle_nr = np.unique(particle, return_inverse=True)[1]
+        key = particle_nr.astype(np.int64)[inside] * ncells + cell[inside]
+        time = time[inside]
+        order = np.lexsort((time, key))
+        key, time = key[order], time[order]
+        first = np.ones(len(key), dtype=bool)
+        first[1:] = key[1:] != key[:-1]
+        key, time = key[first], time[first]
+        visit_particle, visit_cell = key // ncells, key % ncells
+        
+        ## Scatter-add counts and travel times to cells.
+        count += np.bincount(visit_cell, minlength=ncells)
+        traveltime_sum += np.bincount(visit_cell, weights=time, minlength=ncells)
+        np.minimum.at(traveltime_min, visit_cell, time)
+        
+        ## Count flowpaths per cell and well, for flowpaths that end in a well.
+        if nwells > 0:
+            particle_well = get_endpoint_well(chunk, wells).loc[:, 'Well_nr'].values
+            visit_well = particle_well[visit_particle]
+            captured = visit_well >= 0
+            chunk_keys, chunk_counts = np.unique(visit_cell[captured] * nwells + visit_well[captured], return_counts=True)
+            pair_keys, pair_inverse = np.unique(np.r_[pair_keys, chunk_keys], return_inverse=True)
+            pair_counts = np.bincount(pair_inverse, weights=np.r_[pair_counts, chunk_counts]).astype(np.int64)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        traveltime_mean = np.where(count > 0, traveltime_sum / count, np.nan)
+    traveltime_min[count == 0] = np.nan
+    
+    ## Dominant well per cell: the well with the largest count, per cell.
+    dominant_well = np.full(ncells, -1, dtype=np.int64)
+    pair_cell, pair_well = pair_keys // max(nwells, 1), pair_keys % max(nwells, 1)
+    order = np.lexsort((-pair_counts, pair_cell))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pair_cell[order][1:] != pair_cell[order][:-1]
+    dominant_well[pair_cell[order][first]] = pair_well[order][first]
+    
+    ilay, irow, icol = np.unravel_index(pair_cell, (nlay, nrow, ncol))
+    cell_wells = pd.DataFrame({'ILAY': ilay + 1, 'IROW': irow + 1, 'ICOL': icol + 1, 'Well_nr': pair_well, 'count': pair_counts})
+    if wells is not None and 'Name' in wells.columns:
+        cell_wells.insert(4, 'Well_code', wells.loc[:, 'Name'].values[pair_well])
+    
+    shape = (nlay, nrow, ncol)
+    if report:
+        print('Cell visitation derived for', str((count > 0).sum()), 'cells.')
+    return count.reshape(shape), traveltime_min.reshape(shape), traveltime_mean.reshape(shape), dominant_well.reshape(shape), cell_wells
+
+
+def _get_douglas_peucker(x, y, z, first, last, tolerance):
+    '''
+    Returns mask of points kept by Douglas-Peucker simplification in XYZ of all flowpaths [first, last] at once.
+    Each iteration splits all ranges of which an interior point deviates more than tolerance at their farthest point.
+    '''
+    
+    keep = np.zeros(len(x), dtype=bool)
+    keep[first] = True
+    keep[last] = True
+    start, end = first[last - first >= 2], last[last - first >= 2]
+    while len(start) > 0:
+        ## Expand ranges to their interior points.
+        counts = end - start - 1
+        range_nr = np.repeat(np.arange(len(start)), counts)
+        point = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start + 1, counts)
+        
+        ## Distance of interior points to the segment between the first and last point of their range.
+        a = np.column_stack([x[start], y[start], z[start]])[range_nr]
+        b = np.column_stack([x[end], y[end], z[end]])[range_nr]
+        p = np.column_stack([x[point], y[point], z[point]])
+        ab = b - a
+        length = (ab**2).sum(axis=1)
+        s = np.clip(((p - a) * ab).sum(axis=1) / np.where(length > 0, length, 1), 0, 1)
+        distance = np.sqrt(((a + s[:, np.newaxis] * ab - p)**2).sum(axis=1))
+        
+        ## Farthest point of each range.
+        distance_max = np.maximum.reduceat(distance, np.cumsum(counts) - counts)
+        farthest = np.flatnonzero(distance == distance_max[range_nr])
+        range_farthest, index = np.unique(range_nr[farthest], return_index=True)
+        split = point[farthest[index]]
+        
+        split_range = distance_max[range_farthest] > tolerance
+        range_farthest, split = range_farthest[split_range], split[split_range]
+        keep[split] = True
+        start = np.r_[start[range_farthest], split]
+        end = np.r_[split, end[range_farthest]]
+        start, end = start[end - start >= 2], end[end - start >= 2]
+    return keep
+
+
+@profiled(rows=len)
+def simplify_flowpath(data, method='douglas_peucker', tolerance=1., step=None, report=False):
+    '''
+    Simplify or resample all flowpaths at once, to reduce the number of points. The start and endpoint of each flowpath,
+    including their travel time, are kept exactly.
+    
+    
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame with imported .iff flowpath data
+    method : str
+        Simplification method:
+            - 'douglas_peucker': keep points that deviate more than tolerance (in XYZ) from the simplified flowpath.
+            - 'time': resample flowpaths at fixed steps of travel time.
+            - 'distance': resample flowpaths at fixed steps of distance along the flowpath (in XYZ).
+        The default is 'douglas_peucker'.
+    tolerance : float
+        Tolerance in model units (m) of 'douglas_peucker'. The default is 1.
+    step : float
+        Step of 'time' (years) or 'distance' (m). Required for these methods. The default is None.
+    report : bool
+        boolean to print progress report of function. Either True or False. The default is False.
+
+    Returns
+    -------
+    data_simplified : pd.DataFrame
+        DataFrame with simplified flowpaths, sorted by particle and time. The reduction ratio (number of input rows
+        divided by number of output rows) is stored in data_simplified.attrs['reduction_ratio'].
+        For resampled points, columns other than XCRD., YCRD., ZCRD. and TIME(YEARS) are taken from the preceding input point.
+    '''
+    
+    if method not in ['douglas_peucker', 'time', 'distance']:
+        raise ValueError("method should be 'douglas_peucker', 'time' or 'distance', not '" + str(method) + "'")
+    if method in ['time', 'distance'] and (step is None or step <= 0):
+        raise ValueError("step should be a positive number for method '" + method + "'")
+    if report:
+        print('Simplifying flowpaths of', str(len(data)), 'points with method', method)
+    
+    ## Sort rows by particle and time.
+    particle = data.loc[:, 'PARTICLE_NUMBER'].values
+    time = data.loc[:, 'TIME(YEARS)'].values.astype(float)
+    order = np.lexsort((time, particle))
+    data_sorted = data.iloc[order]
+    particle, time = particle[order], time[order]
+    x = data_sorted.loc[:, 'XCRD.'].values.astype(float)
+    y = data_sorted.loc[:, 'YCRD.'].values.astype(float)
+    z = data_sorted.loc[:, 'ZCRD.'].values.astype(float)
+    first = np.flatnonzero(np.r_[True, particle[1:] != particle[:-1]])[:len(particle)]
+    last = np.r_[first[1:], len(particle)][:len(first)] - 1
+    
+    if method == 'douglas_peucker':
+        keep = _get_douglas_peucker(x, y, z, first, last, tolerance)
+        data_simplified = data_sorted.iloc[np.flatnonzero(keep)].reset_index(drop=True)
+    
+    else:
+        ## Parameter along each flowpath: travel time or cumulative distance since the start of the flowpath.
+        if method == 'time':
+            parameter = time - np.repeat(time[first], last - first + 1)
+        else:
+            segment = np.r_[0, np.sqrt(np.diff(x)**2 + np.diff(y)**2 + np.diff(z)**2)]
+            segment[first] = 0
+            parameter = np.cumsum(segment)
+            parameter = parameter - np.repeat(parameter[first], last - first + 1)
+        span = parameter[last]
+        
+        ## Samples at fixed steps, and the endpoint of each flowpath.
+        nsteps = np.floor(span / step).astype(np.int64) + 1
+        nsteps = nsteps - (np.isclose(span, (nsteps - 1) * step) & (nsteps > 1))
+        nsamples = np.where(span > 0, nsteps + 1, 1)
+        sample_particle = np.repeat(np.arange(len(first)), nsamples)
+        sample_start = np.cumsum(nsamples) - nsamples
+        sample_parameter = (np.arange(nsamples.sum()) - np.repeat(sample_start, nsamples)) * step
+        is_start = np.zeros(len(sample_particle), dtype=bool)
+        is_start[sample_start] = True
+        is_end = np.zeros(len(sample_particle), dtype=bool)
+        is_end[sample_start + nsamples - 1] = True
+        sample_parameter[is_end] = span[sample_particle[is_end]]
+        
+        ## Find preceding input point of each sample, using a monotonic parameter over all flowpaths.
+        offset = np.r_[0, np.cumsum(span + 1)[:-1]]
+        parameter_global = parameter + np.repeat(offset, last - first + 1)
+        sample_global = sample_parameter + offset[sample_particle]
+        source = np.searchsorted(parameter_global, sample_global, side='right') - 1
+        source = np.clip(source, first[sample_particle], np.maximum(last[sample_particle] - 1, first[sample_particle]))
+        target = np.minimum(source + 1, last[sample_particle])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip((sample_parameter - parameter[source]) / (parameter[target] - parameter[source]), 0, 1)
+        fraction = np.where(np.isfinite(fraction), fraction, 0)
+        
+        ## Start and endpoints are taken exactly from the input.
+        source = np.where(is_start, first[sample_particle], np.where(is_end, last[sample_particle], source))
+        target = np.where(is_start | is_end, source, target)
+        data_simplified = data_sorted.iloc[source].reset_index(drop=True)
+        for column, values in [('XCRD.', x), ('YCRD.', y), ('ZCRD.', z), ('TIME(YEARS)', time)]:
+            data_simplified.loc[:, column] = (values[source] + fraction * (values[target] - values[source])).astype(data_simplified.loc[:, column].dtype)
+    
+    data_simplified.attrs['reduction_ratio'] = len(data) / max(len(data_simplified), 1)
+    if report:
+        print('Flowpaths simplified from', str(len(data)), 'to', str(len(data_simplified)), 'points, reduction ratio',
+              str(round(data_simplified.attrs['reduction_ratio'], 1)))
+    return data_simplified
+
+
+@profiled(rows=len)
 def invert_flowpath(data, report=False):
     '''
     Function to change direction of flow of particle along a flowpath, thus inverting the travel time along a flowpath.
@@ -121,19 +639,19 @@ def invert_flowpath(data, report=False):
         DataFrame containing flowpath data with inverted direction of flow.
     '''
     
-    particles = data['PARTICLE_NUMBER'].unique()
     if report:
-        print('Inverting direction of flow of',len(particles),'particles in .iff IMOD Flowpath File.')
+        print('Inverting direction of flow of',data['PARTICLE_NUMBER'].nunique(),'particles in .iff IMOD Flowpath File.')
     
     ## For every particle in .iff file, reverse time, by substracting time of particle from maximum time.
-    data_inverted = data.copy()
-    for particle in particles:
-        index_max = data_inverted.loc[data_inverted.loc[:, 'PARTICLE_NUMBER'] == particle, 'TIME(YEARS)'].idxmax()
-        data_inverted.loc[data_inverted.loc[:, 'PARTICLE_NUMBER'] == particle, 'TIME(YEARS)'] = data_inverted.loc[index_max, 'TIME(YEARS)'] - data_inverted.loc[data_inverted.loc[:, 'PARTICLE_NUMBER'] == particle, 'TIME(YEARS)']
+    ## The maximum time of all particles is derived at once with a groupby.
+    time = data.loc[:, 'TIME(YEARS)']
+    time_max = time.groupby(data.loc[:, 'PARTICLE_NUMBER'].values).transform('max')
+    data_inverted = data.assign(**{'TIME(YEARS)': (time_max - time).astype(time.dtype)})
     
     return data_inverted
 
 
+@profiled(rows=len)
 def cutoff_flowpath(data, tmax=25, layer=1, report=False):
     '''
     Function to cutoff flowpaths at give time tmax ending within layer. 
@@ -142,7 +660,7 @@ def cutoff_flowpath(data, tmax=25, layer=1, report=False):
     ----------
     data : pd.DataFrame
         Dataframe which contains the imported flowpath data.
-    tmax : np.float
+    tmax : float
         Time in years at which the flowpaths in 'data' are cutted off. Default is 25 years.
     layer : int
         Layer in which the flowpaths are cutted of. Default is layer 1. 
@@ -158,21 +676,16 @@ def cutoff_flowpath(data, tmax=25, layer=1, report=False):
     if report:
         print('Cutting off time of flowpaths at', str(tmax),'year(s).')
     ## Get all particles that end up in layer, with <= tmax.
-    data_input = data.copy()
-    data_lay = data_input.loc[data_input.loc[:, 'ILAY'] == layer]
-    data_lay = data_lay.loc[data_lay.loc[:, 'TIME(YEARS)'] <= tmax]
-    particles = data_lay.loc[:, 'PARTICLE_NUMBER'].unique()
-    
-    data_output = []
-    for i, particle in enumerate(particles):
-        data_particle = data_input.loc[data.loc[:, 'PARTICLE_NUMBER'] == particle].values
-        data_output.extend(data_particle)
-    data_output = pd.DataFrame(data=data_output, columns=data.columns)
-    data_output = data_output.loc[data_output.loc[:, 'TIME(YEARS)'] <= tmax]
+    within_tmax = data.loc[:, 'TIME(YEARS)'].values <= tmax
+    particles = data.loc[(data.loc[:, 'ILAY'].values == layer) & within_tmax, 'PARTICLE_NUMBER'].unique()
+    
+    ## Boolean selection keeps the (compact) dtypes of data, without copying data first.
+    data_output = data.loc[data.loc[:, 'PARTICLE_NUMBER'].isin(particles).values & within_tmax].reset_index(drop=True)
 
     return data_output
 
 
+@profiled(rows=len)
 def get_geometry(data, line_type='single_line', crs={'init':'epsg:28992'}, save_shp=False, path_output='Output_lines.shp', report=False):
     '''
     Retrieves geometry data of flowpath dataframe and optionally saves geodataframe to shapefile.
@@ -202,6 +715,9 @@ def get_geometry(data, line_type='single_line', crs={'init':'epsg:28992'}, save_
 
     '''
     
+    import geopandas as gpd
+    import shapely.geometry
+    
     ## Copy data of flowpaths
     particles = data.loc[:, 'PARTICLE_NUMBER'].unique()
 
@@ -278,6 +794,7 @@ def get_geometry(data, line_type='single_line', crs={'init':'epsg:28992'}, save_
     return flowpaths_gdf
 
 
+@profiled()
 def dissolve_geometry(data_gdf, save_shp=False, path_output='Output_DissolvedLines.shp', report=False):
     '''
     Function to dissolve geometry of imported flowpath data.
@@ -301,6 +818,9 @@ def dissolve_geometry(data_gdf, save_shp=False, path_output='Output_DissolvedLin
 
     '''
     
+    import geopandas as gpd
+    import shapely.geometry
+    
     if report:
         print('Dissolving geometry of flowpaths.')
     lines = []
@@ -322,6 +842,7 @@ def dissolve_geometry(data_gdf, save_shp=False, path_output='Output_DissolvedLin
     return data_gdf_dissolved
     
 
+@profiled()
 def get_convexhull(data_gdf_dissolved, save_shp=False, path_output='Output_ConvexHull.shp', report=False):
     '''
     Function to generate convex hull of dissolved flowpaths.
@@ -344,6 +865,8 @@ def get_convexhull(data_gdf_dissolved, save_shp=False, path_output='Output_Conve
 
     '''
     
+    import geopandas as gpd
+    
     if report:
         print('Generating convex hull of dissolved flowpaths.')
     convexhull_geom = data_gdf_dissolved.convex_hull.loc[0]
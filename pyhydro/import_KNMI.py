@@ -5,7 +5,10 @@ import datetime as dt
 import numpy as np
 import pandas as pd
 
+from .profiling import profiled
+
 #%%
+@profiled(rows=lambda result: len(result[1]))
 def Import_KNMIstation_daily(path_file):
     '''
     
@@ -41,17 +44,18 @@ def Import_KNMIstation_daily(path_file):
         if line != '':
             line_data = line.strip('\n').split(',')
             line_data = [line_part.strip() for line_part in line_data]
-            line_data = [np.nan if line_part == '' else np.float(line_part) for line_part in line_data]
+            line_data = [np.nan if line_part == '' else float(line_part) for line_part in line_data]
             data_raw.append(line_data)
         else:
             ## Close file.
             file.close
     data_raw = pd.DataFrame(data_raw, columns=header)
-    data_raw.loc[:, 'YYYYMMDD'] = pd.to_datetime(data_raw.loc[:, 'YYYYMMDD'], format='%Y%m%d')
+    data_raw['YYYYMMDD'] = pd.to_datetime(data_raw.loc[:, 'YYYYMMDD'].astype(int).astype(str), format='%Y%m%d')
     data_raw = data_raw.set_index('YYYYMMDD')
     
     return metadata, data_raw
 
+@profiled(rows=len)
 def conv_KNMIdata_daily(data_raw):
     data_conv = data_raw.copy()
     data_conv.loc[:, 'DDVEC'] = data_conv.loc[:, 'DDVEC']
@@ -101,6 +105,7 @@ def conv_KNMIdata_daily(data_raw):
     data_conv.loc[:, 'EV24'] = data_conv.loc[:, 'EV24'] * 0.1 / 1000
     return data_conv
 
+@profiled(rows=len)
 def get_relevantKNMIdata_daily(data_raw, conversion=True):
     '''
     Function to retrieve relevant data for Vitens monitoring wells from raw KNMI station data. 
@@ -125,6 +130,7 @@ def get_relevantKNMIdata_daily(data_raw, conversion=True):
     return data_vitens
         
 
+@profiled(rows=lambda result: len(result[2]))
 def Import_KNMIstation_hourly(path_file):
     '''
     
@@ -171,21 +177,23 @@ def Import_KNMIstation_hourly(path_file):
         if line != '':
             line_data = line.strip('\n').split(',')
             line_data = [line_part.strip() for line_part in line_data]
-            line_data = [np.nan if line_part == '' else np.float(line_part) for line_part in line_data]
+            line_data = [np.nan if line_part == '' else float(line_part) for line_part in line_data]
             data_raw.append(line_data)
         else:
             file.close
     
     ## Post-processing of output data. 
     data_raw = pd.DataFrame(data_raw, columns=header)
-    data_raw.loc[:, 'YYYYMMDD'] = data_raw.loc[:, 'YYYYMMDD'].astype(int).astype(str)
-    data_raw.loc[:, 'date'] = data_raw.loc[:, 'YYYYMMDD'] + np.char.zfill((data_raw.loc[:, 'HH'] - 1).astype(int).astype(str).values.astype(str), 2)
-    data_raw.loc[:, 'HH'] = np.char.zfill((data_raw.loc[:, 'HH']).astype(int).astype(str).values.astype(str), 2)
-    data_raw.loc[:, 'date'] = pd.to_datetime(data_raw.loc[:, 'date'].astype(str), format='%Y%m%d%H') + dt.timedelta(hours=1)
+    ## Columns changing dtype are replaced as a whole, as assigning with .loc keeps the dtype of the column.
+    data_raw['YYYYMMDD'] = data_raw.loc[:, 'YYYYMMDD'].astype(int).astype(str)
+    data_raw['date'] = data_raw.loc[:, 'YYYYMMDD'] + (data_raw.loc[:, 'HH'] - 1).astype(int).astype(str).str.zfill(2)
+    data_raw['HH'] = data_raw.loc[:, 'HH'].astype(int).astype(str).str.zfill(2)
+    data_raw['date'] = pd.to_datetime(data_raw.loc[:, 'date'].astype(str), format='%Y%m%d%H') + dt.timedelta(hours=1)
     data_raw = data_raw.set_index('date')
     
     return metastation, metadata, data_raw
 
+@profiled(rows=len)
 def conv_KNMIdata_hourly(data_raw):
     data_conv = data_raw.copy()
     data_conv.loc[:, 'DD'] = data_conv.loc[:, 'DD']
@@ -214,6 +222,7 @@ def conv_KNMIdata_hourly(data_raw):
     data_conv.loc[:, 'Y'] = data_conv.loc[:, 'Y']
     return data_conv
 
+@profiled(rows=len)
 def get_relevantKNMIdata_hourly(data_raw, conversion=True):
     '''
     Function to retrieve relevant data for Vitens monitoring wells from raw KNMI station data. 
@@ -234,3 +243,245 @@ def get_relevantKNMIdata_hourly(data_raw, conversion=True):
         data_vitens.loc[:, 'pressure'] = data_vitens.loc[:, 'pressure'] * 0.1
     
     return data_vitens
+
+
+@profiled(rows=len)
+def stack_KNMIdata(data_stations, parameter='precipitation', freq=None):
+    '''
+    Function to stack one parameter of several KNMI stations into a single (time x station) DataFrame.
+    Timestamps that are missing at a station are filled with NaN, so gaps stay explicit.
+    
+    
+    Parameters
+    ----------
+    data_stations : dict
+        Dictionary with station numbers as keys and KNMI station data as values,
+        as returned by get_relevantKNMIdata_daily or get_relevantKNMIdata_hourly.
+    parameter : str
+        Column of the station data that is stacked. The default is 'precipitation'.
+    freq : str
+        Optional pandas frequency string (e.g. 'D' or 'H'). If given, the stacked data is reindexed
+        on a regular time axis between the first and last timestamp. The default is None.
+
+    Returns
+    -------
+    data_stack : pd.DataFrame
+        DataFrame with timestamps as index and station numbers as columns.
+    '''
+    
+    data_stack = pd.concat({station: data_station.loc[:, parameter] for station, data_station in data_stations.items()}, axis=1)
+    data_stack = data_stack.sort_index()
+    if freq is not None:
+        data_stack = data_stack.reindex(pd.date_range(data_stack.index[0], data_stack.index[-1], freq=freq))
+    
+    return data_stack
+
+
+@profiled(rows=len)
+def resample_KNMIdata(data_stack, freq='D', how='sum', min_count=1, hour_ending=False):
+    '''
+    Function to resample stacked KNMI station data (e.g. hourly to daily) for all stations at once.
+    
+    
+    Parameters
+    ----------
+    data_stack : pd.DataFrame
+        DataFrame with timestamps as index and station numbers as columns, see stack_KNMIdata.
+    freq : str
+        pandas frequency string of the output. The default is 'D'.
+    how : str
+        Aggregation method: 'sum', 'mean', 'min' or 'max'. The default is 'sum'.
+    min_count : int
+        Minimum number of valid (non-NaN) values within a period. Periods with less valid values are set to NaN.
+        The default is 1.
+    hour_ending : bool
+        Set to True for hourly KNMI data, of which the timestamp marks the end of the hour.
+        The hour ending at 00:00 is then assigned to the previous day. The default is False.
+
+    Returns
+    -------
+    data_resampled : pd.DataFrame
+        Resampled DataFrame with timestamps as index and station numbers as columns.
+    '''
+    
+    if how not in ['sum', 'mean', 'min', 'max']:
+        raise ValueError("how should be 'sum', 'mean', 'min' or 'max', not '" + str(how) + "'")
+    
+    if hour_ending:
+        ## Shift timestamps to the start of each hour, so the hour ending at 00:00 belongs to the previous day,
+        ## without adding empty periods before and after the data.
+        data_stack = data_stack.set_axis(data_stack.index - pd.Timedelta(hours=1), axis=0)
+    data_resample = data_stack.resample(freq)
+    
+    ## Count valid values per period, to mark periods with too many gaps as NaN.
+    count = data_resample.count()
+    if how == 'sum':
+        data_resampled = data_resample.sum()
+    elif how == 'mean':
+        data_resampled = data_resample.sum() / count
+    elif how == 'min':
+        data_resampled = data_resample.min()
+    else:
+        data_resampled = data_resample.max()
+    data_resampled = data_resampled.where(count >= max(min_count, 1))
+    
+    return data_resampled
+
+
+@profiled(rows=len)
+def get_precipitation_surplus(precipitation, evaporation, cumulative=True, nan_policy='skip'):
+    '''
+    Function to calculate (cumulative) precipitation surplus (P - E) for all stations at once.
+    
+    
+    Parameters
+    ----------
+    precipitation : pd.DataFrame
+        Stacked precipitation data, with timestamps as index and station numbers as columns.
+    evaporation : pd.DataFrame
+        Stacked evaporation data, with timestamps as index and station numbers as columns.
+    cumulative : bool
+        If True, the precipitation surplus is accumulated over time. The default is True.
+    nan_policy : str
+        Handling of gaps in the cumulative precipitation surplus:
+            - 'skip': gaps do not contribute to the cumulative sum and stay NaN in the output.
+            - 'zero': gaps do not contribute to the cumulative sum and get the cumulative value of the previous timestep.
+            - 'propagate': the cumulative sum is NaN from the first gap onwards.
+        The default is 'skip'.
+
+    Returns
+    -------
+    surplus : pd.DataFrame
+        (Cumulative) precipitation surplus, with timestamps as index and station numbers as columns.
+    '''
+    
+    if nan_policy not in ['skip', 'zero', 'propagate']:
+        raise ValueError("nan_policy should be 'skip', 'zero' or 'propagate', not '" + str(nan_policy) + "'")
+    
+    precipitation, evaporation = precipitation.align(evaporation, join='outer')
+    surplus = precipitation.values - evaporation.values
+    
+    if cumulative:
+        gaps = np.isnan(surplus)
+        if nan_policy == 'propagate':
+            surplus = np.cumsum(surplus, axis=0)
+        else:
+            surplus = np.nancumsum(surplus, axis=0)
+            if nan_policy == 'skip':
+                surplus[gaps] = np.nan
+    
+    surplus = pd.DataFrame(data=surplus, index=precipitation.index, columns=precipitation.columns)
+    return surplus
+
+
+@profiled()
+def get_rolling_KNMIdata(data_stack, windows=[10, 30, 90], min_periods=None):
+    '''
+    Function to calculate rolling sums over several windows for all stations at once.
+    All windows are derived from a single cumulative sum of the stacked data.
+    
+    
+    Parameters
+    ----------
+    data_stack : pd.DataFrame
+        DataFrame with a regular time axis as index and station numbers as columns.
+        Use stack_KNMIdata with freq, or resample_KNMIdata, to get a regular time axis.
+    windows : list
+        Window lengths, in number of timesteps. The default is [10, 30, 90].
+    min_periods : int
+        Minimum number of valid (non-NaN) values within a window. Windows with less valid values are set to NaN.
+        The default is None, which requires all values within a window to be valid.
+
+    Returns
+    -------
+    data_rolling : dict
+        Dictionary with window lengths as keys and DataFrames with rolling sums as values.
+    '''
+    
+    if len(data_stack) > 2 and len(np.unique(np.diff(data_stack.index.values))) > 1:
+        raise ValueError('data_stack has an irregular time axis. Use stack_KNMIdata with freq or resample_KNMIdata first.')
+    
+    values = data_stack.values.astype(float)
+    valid = ~np.isnan(values)
+    
+    ## Cumulative sum and cumulative count of valid values, with a leading row of zeros.
+    values_cumsum = np.zeros((values.shape[0] + 1, values.shape[1]))
+    values_cumsum[1:] = np.cumsum(np.where(valid, values, 0), axis=0)
+    valid_cumsum = np.zeros((values.shape[0] + 1, values.shape[1]), dtype=np.int64)
+    valid_cumsum[1:] = np.cumsum(valid, axis=0)
+    
+    data_rolling = {}
+    for window in windows:
+        window_min = window if min_periods is None else min_periods
+        window_start = np.maximum(np.arange(1, values.shape[0] + 1) - window, 0)
+        window_sum = values_cumsum[1:] - values_cumsum[window_start]
+        window_count = valid_cumsum[1:] - valid_cumsum[window_start]
+        window_sum[window_count < max(window_min, 1)] = np.nan
+        data_rolling[window] = pd.DataFrame(data=window_sum, index=data_stack.index, columns=data_stack.columns)
+    
+    return data_rolling
+
+
+@profiled(rows=len)
+def get_nearest_KNMIstation(wells, stations, report=False):
+    '''
+    Function to find the nearest KNMI station of each well.
+    
+    
+    Parameters
+    ----------
+    wells : pd.DataFrame
+        Dataframe containing the wells. Contains at least a column "X" with x-coordinates and a column "Y" with y-coordinates.
+    stations : pd.DataFrame
+        Dataframe with station numbers as index. Contains at least a column "X" and a column "Y",
+        in the same coordinate reference system as the wells.
+    report : bool
+        boolean to print progress report. Either True or False. The default is False
+
+    Returns
+    -------
+    wells : pd.DataFrame
+        Original dataframe with added columns "STN", containing the nearest station number,
+        and "STN_distance", containing the distance to that station.
+    '''
+    
+    if report:
+        print('Finding nearest KNMI station for', str(len(wells)), 'wells')
+    dx = wells.loc[:, 'X'].values[:, np.newaxis] - stations.loc[:, 'X'].values[np.newaxis, :]
+    dy = wells.loc[:, 'Y'].values[:, np.newaxis] - stations.loc[:, 'Y'].values[np.newaxis, :]
+    distance = np.hypot(dx, dy)
+    nearest = np.argmin(distance, axis=1)
+    
+    wells.loc[:, 'STN'] = stations.index.values[nearest]
+    wells.loc[:, 'STN_distance'] = distance[np.arange(len(wells)), nearest]
+    return wells
+
+
+@profiled(rows=len)
+def get_well_KNMIdata(data_stack, wells, station_column='STN'):
+    '''
+    Function to broadcast stacked KNMI station data to wells, using the station number of each well.
+    
+    
+    Parameters
+    ----------
+    data_stack : pd.DataFrame
+        DataFrame with timestamps as index and station numbers as columns.
+    wells : pd.DataFrame
+        Dataframe containing the wells, with station numbers in column station_column (see get_nearest_KNMIstation).
+    station_column : str
+        Column of wells containing the station numbers. The default is 'STN'.
+
+    Returns
+    -------
+    data_wells : pd.DataFrame
+        DataFrame with timestamps as index and the index of wells as columns.
+    '''
+    
+    station_index = data_stack.columns.get_indexer(wells.loc[:, station_column].values)
+    if (station_index == -1).any():
+        missing = np.unique(wells.loc[station_index == -1, station_column].values)
+        raise ValueError('No KNMI data available for station(s): ' + ', '.join([str(station) for station in missing]))
+    
+    data_wells = pd.DataFrame(data=data_stack.values[:, station_index], index=data_stack.index, columns=wells.index)
+    return data_wells
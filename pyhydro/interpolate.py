@@ -0,0 +1,283 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+import scipy.spatial
+
+from .profiling import profiled
+
+#%%
+## Cache of interpolation weights, with station coordinates, grid coordinates and method as key.
+_weights_cache = {}
+
+
+def clear_interpolation_cache():
+    '''
+    Function to clear all cached interpolation weights.
+    '''
+
+    _weights_cache.clear()
+
+
+def _get_grid_points(grid_xs, grid_ys):
+    '''
+    Returns coordinates of all cell centers of a grid, ordered row by row (same order as idf_values.ravel()).
+    '''
+
+    grid_x, grid_y = np.meshgrid(grid_xs, grid_ys)
+    return np.column_stack([grid_x.ravel(), grid_y.ravel()])
+
+
+def _get_kriging_weights(station_xy, distance, neighbours, variogram_range, nugget, chunksize=100000):
+    '''
+    Returns ordinary kriging weights of the neighbouring stations of each grid cell, using an exponential variogram.
+    The kriging systems of all grid cells are solved in batches of chunksize cells.
+    '''
+
+    def variogram(h):
+        return np.where(h > 0, nugget + (1 - nugget) * (1 - np.exp(-h / variogram_range)), 0)
+
+    ncells, k = neighbours.shape
+    weights = np.zeros((ncells, k))
+    for start in range(0, ncells, chunksize):
+        neighbours_chunk = neighbours[start:start+chunksize]
+        xy = station_xy[neighbours_chunk]
+
+        ## Kriging system [[gamma(station, station), 1], [1, 0]] [w, mu] = [gamma(station, cell), 1]
+        A = np.ones((len(xy), k + 1, k + 1))
+        A[:, :k, :k] = variogram(np.linalg.norm(xy[:, :, np.newaxis, :] - xy[:, np.newaxis, :, :], axis=-1))
+        A[:, k, k] = 0
+        b = np.ones((len(xy), k + 1, 1))
+        b[:, :k, 0] = variogram(distance[start:start+chunksize])
+        weights[start:start+chunksize] = np.linalg.solve(A, b)[:, :k, 0]
+    return weights
+
+
+@profiled(rows=lambda result: result.shape[0])
+def get_interpolation_weights(stations, grid_xs, grid_ys, method='idw', n_neighbours=8, power=2, variogram_range=None, nugget=0., cache=True, report=False):
+    '''
+    Function to derive a sparse weight matrix to interpolate station data onto a grid.
+    Weights are cached per set of stations, grid and interpolation settings, so they are derived only once.
+
+
+    Parameters
+    ----------
+    stations : pd.DataFrame
+        Dataframe with station numbers as index. Contains at least a column "X" and a column "Y",
+        in the same coordinate reference system as the grid.
+    grid_xs : array
+        x-coordinates of cell centers of the grid, e.g. idf_xs of import_idf.
+    grid_ys : array
+        y-coordinates of cell centers of the grid, e.g. idf_ys of import_idf.
+    method : str
+        Interpolation method:
+            - 'nearest': value of nearest station (Thiessen polygons).
+            - 'idw': inverse distance weighting of the n_neighbours nearest stations.
+            - 'kriging': ordinary kriging of the n_neighbours nearest stations, with an exponential variogram.
+        The default is 'idw'.
+    n_neighbours : int
+        Number of nearest stations used for 'idw' and 'kriging'. The default is 8.
+    power : float
+        Power of inverse distance weighting. The default is 2.
+    variogram_range : float
+        Range of exponential variogram for 'kriging'. The default is None, which uses half of the largest station distance.
+    nugget : float
+        Nugget of exponential variogram for 'kriging', as fraction of the sill. The default is 0.
+    cache : bool
+        If True, derived weights are cached until clear_interpolation_cache is called. If False, the cache is
+        neither used nor filled. The default is True.
+    report : bool
+        boolean to print progress report. Either True or False. The default is False
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        Sparse matrix of shape (number of grid cells, number of stations).
+        Grid values are derived as weights @ station_values, and ordered row by row.
+    '''
+
+    if method not in ['nearest', 'idw', 'kriging']:
+        raise ValueError("method should be 'nearest', 'idw' or 'kriging', not '" + str(method) + "'")
+
+    station_xy = np.column_stack([stations.loc[:, 'X'].values, stations.loc[:, 'Y'].values]).astype(float)
+    grid_xs = np.asarray(grid_xs, dtype=float)
+    grid_ys = np.asarray(grid_ys, dtype=float)
+    key = (method, n_neighbours, power, variogram_range, nugget, station_xy.tobytes(), grid_xs.tobytes(), grid_ys.tobytes())
+    if cache and key in _weights_cache:
+        return _weights_cache[key]
+
+    if report:
+        print('Deriving', method, 'interpolation weights of', str(len(station_xy)), 'stations for grid of', str(len(grid_ys)), 'x', str(len(grid_xs)), 'cells')
+    grid_xy = _get_grid_points(grid_xs, grid_ys)
+    nstations = len(station_xy)
+    k = 1 if method == 'nearest' else min(n_neighbours, nstations)
+
+    ## Find nearest stations of all grid cells at once.
+    tree = scipy.spatial.cKDTree(station_xy)
+    distance, neighbours = tree.query(grid_xy, k=k)
+    distance = distance.reshape(len(grid_xy), k)
+    neighbours = neighbours.reshape(len(grid_xy), k)
+
+    if method == 'nearest':
+        weights = np.ones((len(grid_xy), 1))
+    elif method == 'idw':
+        with np.errstate(divide='ignore'):
+            weights = 1 / distance ** power
+        ## Grid cells at a station location get the value of that station.
+        at_station = distance[:, 0] == 0
+        weights[at_station] = 0
+        weights[at_station, 0] = 1
+        weights = weights / weights.sum(axis=1)[:, np.newaxis]
+    else:
+        if variogram_range is None:
+            variogram_range = scipy.spatial.distance.pdist(station_xy).max() / 2
+        weights = _get_kriging_weights(station_xy, distance, neighbours, variogram_range, nugget)
+
+    weights = scipy.sparse.csr_matrix((weights.ravel(), neighbours.ravel(), np.arange(0, weights.size + 1, k)),
+                                      shape=(len(grid_xy), nstations))
+    if cache:
+        _weights_cache[key] = weights
+    return weights
+
+
+def iter_interpolated_KNMIdata(data_stack, stations, grid_xs, grid_ys, method='idw', max_missing_weights=8, report=False, **kwargs):
+    '''
+    Generator to interpolate stacked KNMI station data onto a grid, timestep by timestep.
+    Interpolation weights are derived once (see get_interpolation_weights), after which each timestep
+    is a single sparse matrix-vector product. At timesteps with missing station data, weights are derived for the
+    remaining stations (kriging is solved again, nearest and idw use the next nearest stations). These are only kept
+    during the interpolation, for the max_missing_weights most recently used sets of missing stations.
+
+
+    Parameters
+    ----------
+    data_stack : pd.DataFrame
+        DataFrame with timestamps as index and station numbers as columns, see stack_KNMIdata.
+    stations : pd.DataFrame
+        Dataframe with station numbers as index and columns "X" and "Y". Contains at least all stations of data_stack.
+    grid_xs : array
+        x-coordinates of cell centers of the grid, e.g. idf_xs of import_idf.
+    grid_ys : array
+        y-coordinates of cell centers of the grid, e.g. idf_ys of import_idf.
+    method : str
+        Interpolation method: 'nearest', 'idw' or 'kriging'. The default is 'idw'.
+    max_missing_weights : int
+        Maximum number of sets of missing stations of which the weights are kept. The default is 8.
+    report : bool
+        boolean to print progress report. Either True or False. The default is False
+    **kwargs
+        Other settings of get_interpolation_weights.
+
+    Yields
+    ------
+    time : pd.Timestamp
+        Timestamp of interpolated grid.
+    grid_values : array
+        Interpolated grid, of shape (len(grid_ys), len(grid_xs)).
+        At timesteps without any station data, all grid cells are NaN.
+    '''
+
+    stations = stations.loc[data_stack.columns]
+    if method == 'kriging' and kwargs.get('variogram_range') is None and len(stations) > 1:
+        ## Use the variogram of all stations, also for timesteps with missing stations.
+        station_xy = np.column_stack([stations.loc[:, 'X'].values, stations.loc[:, 'Y'].values]).astype(float)
+        kwargs['variogram_range'] = scipy.spatial.distance.pdist(station_xy).max() / 2
+    weights = get_interpolation_weights(stations, grid_xs, grid_ys, method=method, report=report, **kwargs)
+    weights_missing = OrderedDict()
+    shape = (len(grid_ys), len(grid_xs))
+
+    if report:
+        print('Interpolating', str(len(data_stack)), 'timesteps')
+    values = data_stack.values.astype(float)
+    for time, station_values in zip(data_stack.index, values):
+        valid = ~np.isnan(station_values)
+        if valid.all():
+            grid_values = weights @ station_values
+        elif not valid.any():
+            grid_values = np.full(weights.shape[0], np.nan)
+        else:
+            ## Weights of the remaining stations only, kept by the set of missing stations, dropping the least recently used.
+            key = valid.tobytes()
+            if key in weights_missing:
+                weights_missing.move_to_end(key)
+            else:
+                weights_missing[key] = get_interpolation_weights(stations.loc[valid], grid_xs, grid_ys, method=method, **{**kwargs, 'cache': False})
+                if len(weights_missing) > max_missing_weights:
+                    weights_missing.popitem(last=False)
+            grid_values = weights_missing[key] @ station_values[valid]
+        yield time, grid_values.reshape(shape)
+
+
+@profiled(rows=lambda result: result.size)
+def interpolate_KNMIdata(data_stack, stations, grid_xs, grid_ys, method='idw', report=False, **kwargs):
+    '''
+    Function to interpolate stacked KNMI station data onto a grid, for all timesteps at once.
+
+
+    Parameters
+    ----------
+    data_stack : pd.DataFrame
+        DataFrame with timestamps as index and station numbers as columns, see stack_KNMIdata.
+    stations : pd.DataFrame
+        Dataframe with station numbers as index and columns "X" and "Y". Contains at least all stations of data_stack.
+    grid_xs : array
+        x-coordinates of cell centers of the grid, e.g. idf_xs of import_idf.
+    grid_ys : array
+        y-coordinates of cell centers of the grid, e.g. idf_ys of import_idf.
+    method : str
+        Interpolation method: 'nearest', 'idw' or 'kriging'. The default is 'idw'.
+    report : bool
+        boolean to print progress report. Either True or False. The default is False
+    **kwargs
+        Other settings of get_interpolation_weights, or max_missing_weights of iter_interpolated_KNMIdata.
+
+    Returns
+    -------
+    grid_values : array
+        Interpolated grids, of shape (len(data_stack), len(grid_ys), len(grid_xs)).
+    '''
+
+    grid_values = np.empty((len(data_stack), len(grid_ys), len(grid_xs)))
+    for i, (time, grid_values_time) in enumerate(iter_interpolated_KNMIdata(data_stack, stations, grid_xs, grid_ys, method=method, report=report, **kwargs)):
+        grid_values[i] = grid_values_time
+    return grid_values
+
+
+@profiled()
+def save_interpolated_idf(path_idf, data_stack, stations, grid_xs, grid_ys, method='idw', nodata=1.e20, report=False, **kwargs):
+    '''
+    Function to interpolate stacked KNMI station data onto a grid and save each timestep as .idf file.
+    Timesteps are interpolated and written one by one, so only a single grid is kept in memory.
+
+
+    Parameters
+    ----------
+    path_idf : str
+        Basepath of saved .idf files. The date of each timestep is added to the file name by imod.
+    data_stack : pd.DataFrame
+        DataFrame with timestamps as index and station numbers as columns, see stack_KNMIdata.
+    stations : pd.DataFrame
+        Dataframe with station numbers as index and columns "X" and "Y". Contains at least all stations of data_stack.
+    grid_xs : array
+        x-coordinates of cell centers of the grid, e.g. idf_xs of import_idf.
+    grid_ys : array
+        y-coordinates of cell centers of the grid, e.g. idf_ys of import_idf.
+    method : str
+        Interpolation method: 'nearest', 'idw' or 'kriging'. The default is 'idw'.
+    nodata : float
+        No data value of saved .idf files. The default is 1.e20.
+    report : bool
+        boolean to print progress report. Either True or False. The default is False
+    **kwargs
+        Other settings of get_interpolation_weights, or max_missing_weights of iter_interpolated_KNMIdata.
+    '''
+
+    import imod
+    import xarray as xr
+
+    for time, grid_values in iter_interpolated_KNMIdata(data_stack, stations, grid_xs, grid_ys, method=method, report=report, **kwargs):
+        grid = xr.DataArray(grid_values[np.newaxis], coords={'time': [pd.Timestamp(time)], 'y': grid_ys, 'x': grid_xs}, dims=('time', 'y', 'x'))
+        imod.idf.save(path_idf, grid, nodata=nodata)
+    if report:
+        print('Interpolated grids of', str(len(data_stack)), 'timesteps saved to', path_idf)
@@ -1,9 +1,13 @@
 import numpy as np
 import pandas as pd
 
+from .profiling import profiled
+from .schema import IPF_DTYPES, get_dtypes
+
 
 #%% 
-def import_ipf(path_ipf, report=False):
+@profiled(rows=lambda result: len(result[0]))
+def import_ipf(path_ipf, float32_time=False, report=False):
     '''
     imports .ipf iMOD flowpath data and returns dataframe
     
@@ -12,13 +16,16 @@ def import_ipf(path_ipf, report=False):
     ----------
     path_ipf : str
         Path to .ipf file
+    float32_time : bool
+        If True, travel time is stored as float32 instead of float64. The default is False
     report : bool
         boolean to print progress report. Either True or False. The default is False
         
     Returns
     -------
     ipf_data : pd.DataFrame
-        Dataframe containing the imported .ipf data
+        Dataframe containing the imported .ipf data. Layer, row and column numbers are stored as
+        compact integers (see schema.IPF_DTYPES), coordinates as float64.
     ipf_xs : array
         array containing all x-coordinates of .ipf data
     ipf_ys : array
@@ -41,34 +48,27 @@ def import_ipf(path_ipf, report=False):
     ipf_header = []
     for i in range(Nheader):
         ipf_header.append(file.readline().strip())
-    file.readline().strip()
-    
-    ## Import data lines. 
-    ipf_data = []
-    for i in range(Ndata):
-        ipf_data.append(file.readline().strip().split())
     file.close()
     
-    ## Convert imported data to dataframe.
+    ## Import data lines directly to dataframe, with compact dtypes.
     if report:
         print('Converting .ipf-data to DataFrame')
-    ipf_data = pd.DataFrame(data=ipf_data, columns=ipf_header, dtype=np.float)    
+    ipf_data = pd.read_csv(path_ipf, sep=r'\s+', header=None, names=ipf_header, skiprows=2 + Nheader + 1, nrows=Ndata,
+                           dtype=get_dtypes(ipf_header, IPF_DTYPES, float32_time=float32_time))
     
     ## Extracting x- and y-coordinates of imodpath data.
     ipf_xs = ipf_data.loc[:, 'SP_XCRD.'].sort_values(ascending=True).drop_duplicates().values
     ipf_ys = ipf_data.loc[:, 'SP_YCRD.'].sort_values(ascending=False).drop_duplicates().values
     
     ## Translating x- and y-coordinates to cols and row values of imodpath data.
-    for i, index in enumerate(ipf_data.index):
-        i_col = np.argmin(abs(ipf_xs - ipf_data.loc[index, 'SP_XCRD.']))
-        i_row = np.argmin(abs(ipf_ys - ipf_data.loc[index, 'SP_YCRD.']))
-    
-        ipf_data.loc[index, 'imodpath_col'] = i_col
-        ipf_data.loc[index, 'imodpath_row'] = i_row
+    ## Coordinates are taken from ipf_xs and ipf_ys themselves, so each coordinate is found exactly.
+    ipf_data.loc[:, 'imodpath_col'] = np.searchsorted(ipf_xs, ipf_data.loc[:, 'SP_XCRD.'].values).astype(np.int32)
+    ipf_data.loc[:, 'imodpath_row'] = np.searchsorted(-ipf_ys, -ipf_data.loc[:, 'SP_YCRD.'].values).astype(np.int32)
     
     return ipf_data, ipf_xs, ipf_ys
 
 
+@profiled(rows=lambda result: len(result[0]))
 def get_well_cells(wells, model_xs, model_ys, model_dx=25, report=False):
     '''
     takes a dataframe with wells and converts coordinates to cell-numbers of model. 
@@ -127,6 +127,7 @@ def get_well_cells(wells, model_xs, model_ys, model_dx=25, report=False):
     return wells, well_bundle
 
 
+@profiled(rows=lambda result: len(result[2]))
 def flowpath_origin(wells, ipf_data, ipf_xs, ipf_ys, report=False):
     '''
     extracts all .ipf flowpaths that end up in wells. 
@@ -160,8 +161,8 @@ def flowpath_origin(wells, ipf_data, ipf_xs, ipf_ys, report=False):
         dataframe with all .ipf flowpaths that end up in the provided wells.
     '''
     
-    ## setting up dataframe for flowpaths that end up in wells
-    ipf_data_well = pd.DataFrame()
+    ## setting up list of flowpaths that end up in wells, concatenated to a single dataframe afterwards
+    ipf_data_well = []
     
     if report:
         print('setting up output rasters for origins and traveltimes of provided flowpaths')
@@ -178,15 +179,19 @@ def flowpath_origin(wells, ipf_data, ipf_xs, ipf_ys, report=False):
         well_data = ipf_data.loc[(ipf_data.loc[:, 'EP_IROW'] == well_IROW) & (ipf_data.loc[:, 'EP_ICOL'] == well_ICOL)].copy()
         
         if len(well_data) > 0:
-            well_data.loc[:, 'Well_nr'] = well_i
+            well_data.loc[:, 'Well_nr'] = np.int32(well_i)
             well_data.loc[:, 'Well_code'] = wells.loc[well_index, 'Name']
-            ipf_data_well = ipf_data_well.append(well_data)
-            for flowpath_i, flowpath_index in enumerate(well_data.index):
-                flowpath_SP_IROW = int(well_data.loc[flowpath_index, 'imodpath_row'])
-                flowpath_SP_ICOL = int(well_data.loc[flowpath_index, 'imodpath_col'])
-                
-                ipf_traveltimes[flowpath_SP_IROW, flowpath_SP_ICOL] = well_data.loc[flowpath_index, 'TIME(YEARS)']
-                ipf_origin[flowpath_SP_IROW, flowpath_SP_ICOL] = well_i
+            ipf_data_well.append(well_data)
+            
+            flowpath_SP_IROW = well_data.loc[:, 'imodpath_row'].values
+            flowpath_SP_ICOL = well_data.loc[:, 'imodpath_col'].values
+            ipf_traveltimes[flowpath_SP_IROW, flowpath_SP_ICOL] = well_data.loc[:, 'TIME(YEARS)'].values
+            ipf_origin[flowpath_SP_IROW, flowpath_SP_ICOL] = well_i
+    
+    if ipf_data_well:
+        ipf_data_well = pd.concat(ipf_data_well)
+    else:
+        ipf_data_well = ipf_data.iloc[:0].assign(Well_nr=np.int32(0), Well_code='')
     
     return ipf_origin, ipf_traveltimes, ipf_data_well
 
@@ -0,0 +1,290 @@
+import numpy as np
+import pandas as pd
+
+from . import iff
+from .profiling import profiled, stage
+from .schema import IFF_DTYPES, get_dtypes
+
+#%%
+## Columns of .iff data used by each operation of a pipeline.
+_operation_columns = {'extract_endpointwell': ['IROW', 'ICOL'],
+                      'cutoff_flowpath': ['ILAY', 'TIME(YEARS)'],
+                      'invert_flowpath': ['TIME(YEARS)'],
+                      'simplify_flowpath': ['XCRD.', 'YCRD.', 'ZCRD.', 'TIME(YEARS)']}
+
+## Operations that select particles. These are pushed down to the first pass over the file.
+_filter_operations = ['extract_endpointwell', 'cutoff_flowpath']
+
+
+class FlowpathPipeline:
+    '''
+    Lazy pipeline of operations on the flowpaths of a .iff file, created with scan_iff.
+    Operations are only recorded, and executed by collect, get_geometry or get_convexhull as a streaming plan
+    of two passes over the file:
+        1. Read only the columns used by the filters (extract_endpointwell, cutoff_flowpath) in chunks of complete
+           flowpaths, and find the particles that pass all filters.
+        2. Read all columns of only the rows spanned by these particles, drop the rows of other particles per chunk
+           and apply all operations, and the geometry, on the fly.
+    Peak memory is proportional to the chunk size and the output, not to the size of the file.
+    Operations give the same result as the functions with the same name in iff applied to the imported file,
+    as each of them only depends on the rows of a single particle. Like import_iff_chunks, this requires that
+    the rows of each particle are stored consecutively, as written by iMOD.
+    '''
+
+    def __init__(self, path_iff, chunksize=1000000, float32_time=False, operations=()):
+        self.path_iff = path_iff
+        self.chunksize = chunksize
+        self.float32_time = float32_time
+        self.operations = tuple(operations)
+
+    def _add(self, name, **kwargs):
+        return FlowpathPipeline(self.path_iff, chunksize=self.chunksize, float32_time=self.float32_time,
+                                operations=self.operations + ((name, kwargs),))
+
+    def extract_endpointwell(self, well_cells):
+        '''
+        Keep flowpaths which end up at well cells, see iff.extract_endpointwell. Returns a new pipeline.
+        '''
+
+        return self._add('extract_endpointwell', well_cells=[tuple(well_cell) for well_cell in well_cells])
+
+    def cutoff_flowpath(self, tmax=25, layer=1):
+        '''
+        Cutoff flowpaths at time tmax ending within layer, see iff.cutoff_flowpath. Returns a new pipeline.
+        '''
+
+        return self._add('cutoff_flowpath', tmax=tmax, layer=layer)
+
+    def invert_flowpath(self):
+        '''
+        Invert the direction of flow of flowpaths, see iff.invert_flowpath. Returns a new pipeline.
+        '''
+
+        return self._add('invert_flowpath')
+
+    def simplify_flowpath(self, method='douglas_peucker', tolerance=1., step=None):
+        '''
+        Simplify or resample flowpaths, see iff.simplify_flowpath. Returns a new pipeline.
+        '''
+
+        return self._add('simplify_flowpath', method=method, tolerance=tolerance, step=step)
+
+    def _get_filter_operations(self):
+        '''
+        Returns the operations up to and including the last filter, which are needed to select particles.
+        '''
+
+        n_filter = 0
+        for i, (name, kwargs) in enumerate(self.operations):
+            if name in _filter_operations:
+                n_filter = i + 1
+        return self.operations[:n_filter]
+
+    def _get_filter_columns(self):
+        columns = ['PARTICLE_NUMBER']
+        for name, kwargs in self._get_filter_operations():
+            columns.extend(column for column in _operation_columns[name] if column not in columns)
+        return columns
+
+    def explain(self):
+        '''
+        Returns a description of the execution plan of the pipeline.
+        '''
+
+        def describe(operations):
+            return ', '.join(name + '(' + ', '.join(key + '=' + repr(value) for key, value in kwargs.items()) + ')'
+                             for name, kwargs in operations) or 'none'
+
+        plan = ['scan_iff(' + repr(self.path_iff) + ') in chunks of ' + str(self.chunksize) + ' rows']
+        if self._get_filter_operations():
+            plan.append('pass 1: read columns ' + ', '.join(self._get_filter_columns()) + ' and select particles with '
+                        + describe(self._get_filter_operations()))
+            plan.append('pass 2: read all columns of the rows of selected particles and apply ' + describe(self.operations))
+        else:
+            plan.append('single pass: read all columns and apply ' + describe(self.operations))
+        return '\n'.join(plan)
+
+    def _apply(self, data):
+        for name, kwargs in self.operations:
+            data = getattr(iff, name)(data, **kwargs)
+        return data
+
+    def _get_empty(self):
+        '''
+        Returns the (empty) result of the pipeline on a file without flowpaths.
+        '''
+
+        columns, nheader = iff._read_iff_header(self.path_iff)
+        dtypes = get_dtypes(columns, IFF_DTYPES, float32_time=self.float32_time)
+        return self._apply(pd.DataFrame({column: np.array([], dtype=dtypes[column]) for column in columns}))
+
+    def _select_particles(self, report=False):
+        '''
+        First pass: returns the selected particles, in the order of the file, and the first row (counted from the
+        first data row) of their flowpaths.
+        '''
+
+        filter_pipeline = FlowpathPipeline(self.path_iff, chunksize=self.chunksize, float32_time=self.float32_time,
+                                           operations=self._get_filter_operations())
+        if report:
+            print('Selecting particles in', self.path_iff, 'with', ', '.join(name for name, kwargs in filter_pipeline.operations))
+        particles = []
+        first_row = None
+        with stage('pipeline.select_particles') as select_stage:
+            nrows = 0
+            for start, chunk in iff._iter_iff_chunks(self.path_iff, chunksize=self.chunksize, usecols=self._get_filter_columns(),
+                                                     float32_time=self.float32_time):
+                nrows += len(chunk)
+                selected = filter_pipeline._apply(chunk).loc[:, 'PARTICLE_NUMBER'].unique()
+                if len(selected) > 0:
+                    if first_row is None:
+                        first_row = start + np.argmax(chunk.loc[:, 'PARTICLE_NUMBER'].isin(selected).values)
+                    particles.append(selected)
+            select_stage.rows = nrows
+        particles = np.concatenate(particles) if particles else np.array([], dtype=IFF_DTYPES['PARTICLE_NUMBER'])
+        if report:
+            print(str(len(particles)), 'particles selected out of', str(nrows), 'rows')
+        return particles, first_row
+
+    def _execute(self, report=False):
+        '''
+        Second pass: yields chunks of complete flowpaths with all operations applied. Yields at least one,
+        possibly empty, chunk.
+        '''
+
+        particles = None
+        start = 0
+        if self._get_filter_operations():
+            particles, start = self._select_particles(report=report)
+            if len(particles) == 0:
+                yield self._get_empty()
+                return
+
+        if report:
+            print('Applying', ', '.join(name for name, kwargs in self.operations) or 'no operations', 'to', self.path_iff)
+        ## The first row of the selected particles is used as the first line to read. Blank lines are counted as lines,
+        ## but not as rows, so reading may start early but never late: rows of other particles are dropped.
+        ## Reading stops after the last selected particle, as the rows of each particle are stored consecutively.
+        empty = True
+        for chunk_start, chunk in iff._iter_iff_chunks(self.path_iff, chunksize=self.chunksize, start=start,
+                                                       float32_time=self.float32_time):
+            last_chunk = False
+            if particles is not None:
+                last_chunk = (chunk.loc[:, 'PARTICLE_NUMBER'].values == particles[-1]).any()
+                chunk = chunk.loc[chunk.loc[:, 'PARTICLE_NUMBER'].isin(particles).values]
+            chunk = self._apply(chunk)
+            if len(chunk) > 0:
+                empty = False
+                yield chunk
+            if last_chunk:
+                break
+        if empty:
+            yield self._get_empty()
+
+    @profiled(rows=len)
+    def collect(self, report=False):
+        '''
+        Execute the pipeline and return the resulting flowpath data.
+
+
+        Parameters
+        ----------
+        report : bool
+            boolean to print progress report. Either True or False. The default is False
+
+        Returns
+        -------
+        data : pd.DataFrame
+            dataframe with flowpath data after all operations of the pipeline
+        '''
+
+        return pd.concat(list(self._execute(report=report)), ignore_index=True)
+
+    @profiled(rows=len)
+    def get_geometry(self, line_type='single_line', crs={'init':'epsg:28992'}, save_shp=False, path_output='Output_lines.shp', report=False):
+        '''
+        Execute the pipeline and return the geometry of the resulting flowpaths, derived per chunk.
+        See iff.get_geometry for the parameters and the returned GeoDataFrame.
+        '''
+
+        flowpaths_gdf = pd.concat([iff.get_geometry(chunk, line_type=line_type, crs=crs) for chunk in self._execute(report=report)],
+                                  ignore_index=True)
+        if save_shp:
+            flowpaths_gdf.to_file(filename=path_output, driver='ESRI Shapefile')
+            if report:
+                print('Geometry of flowpaths is saved to shapefile:', path_output)
+        return flowpaths_gdf
+
+    @profiled()
+    def get_convexhull(self, save_shp=False, path_output='Output_ConvexHull.shp', report=False):
+        '''
+        Execute the pipeline and return the convex hull of the resulting flowpaths (the capture zone), updated per chunk
+        without storing the flowpaths. Gives the same result as get_geometry, dissolve_geometry and get_convexhull of iff.
+
+
+        Parameters
+        ----------
+        save_shp : bool
+            Either True or False. If True, the convex hull is saved to shapefile. The default is False.
+        path_output : str
+            Output path of shapefile. The default is Output_ConvexHull.shp'.
+        report: bool
+            boolean to print progress report of function. Either True or False. The default is False.
+
+        Returns
+        -------
+        data_gdf_convexhull : gpd.GeoDataFrame
+            Output GeoDataFrame containing the geometry of generated convex hull.
+        '''
+
+        import geopandas as gpd
+        import shapely.geometry
+
+        hull = shapely.geometry.Polygon()
+        hull_points = np.empty((0, 2))
+        for chunk in self._execute(report=report):
+            ## Only flowpaths with more than one point have a line geometry, see iff.get_geometry.
+            chunk = chunk.loc[chunk.loc[:, 'PARTICLE_NUMBER'].duplicated(keep=False).values]
+            if len(chunk) == 0:
+                continue
+            ## The hull of all points equals the hull of the points of the previous hull and the new points.
+            points = np.vstack([hull_points, chunk.loc[:, ['XCRD.', 'YCRD.']].values.astype(float)])
+            hull = shapely.geometry.MultiPoint(points).convex_hull
+            hull_points = np.asarray(hull.exterior.coords if hull.geom_type == 'Polygon' else hull.coords)[:, :2]
+
+        data_gdf_convexhull = gpd.GeoDataFrame(data=[['ConvexHull', hull]], columns=['Name', 'geometry'])
+        if save_shp:
+            data_gdf_convexhull.to_file(filename=path_output, driver='ESRI Shapefile')
+            if report:
+                print('Geometry of generated convex hull is saved to shapefile:', path_output)
+        return data_gdf_convexhull
+
+
+def scan_iff(path_iff, chunksize=1000000, float32_time=False):
+    '''
+    Start a lazy pipeline on a .iff iMOD flowpath file. Nothing is read until the pipeline is executed,
+    see FlowpathPipeline.
+
+    Example:
+        capture_zone = (pyhydro.scan_iff(path_iff)
+                               .extract_endpointwell(well_cells)
+                               .cutoff_flowpath(tmax=25, layer=1)
+                               .get_convexhull())
+
+
+    Parameters
+    ----------
+    path_iff : str
+        Path to .iff file
+    chunksize : int
+        Approximate number of rows read per chunk. The default is 1000000.
+    float32_time : bool
+        If True, travel time is stored as float32 instead of float64. The default is False
+
+    Returns
+    -------
+    pipeline : FlowpathPipeline
+        Lazy pipeline without operations.
+    '''
+
+    return FlowpathPipeline(path_iff, chunksize=chunksize, float32_time=float32_time)
@@ -0,0 +1,238 @@
+import functools
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+#%%
+## Active profilers and registered hooks. Stages are only recorded when at least one of both is present.
+_profilers = []
+_hooks = []
+_local = threading.local()
+
+logger = logging.getLogger('pyhydro.profiling')
+
+
+def add_hook(hook):
+    '''
+    Register a function that is called with the record (dict) of every finished stage.
+
+    Parameters
+    ----------
+    hook : callable
+        Function with a single argument: the record of a stage, see Profiler.
+    '''
+
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    '''
+    Remove a function registered with add_hook.
+
+    Parameters
+    ----------
+    hook : callable
+        Function registered with add_hook.
+    '''
+
+    _hooks.remove(hook)
+
+
+def _get_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+class _Stage:
+    '''
+    Context manager measuring wall time, number of rows and peak memory of a single stage.
+    '''
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.child_peak = 0
+
+    def __enter__(self):
+        stack = _get_stack()
+        self.parent = stack[-1] if stack else None
+        self.memory = tracemalloc.is_tracing()
+        if self.memory:
+            ## Store peak of parent stage so far, before resetting the peak for this stage.
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:
+                self.parent.child_peak = max(self.parent.child_peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_time = time.perf_counter() - self.start
+        _get_stack().pop()
+        record = {'stage': self.name,
+                  'parent': None if self.parent is None else self.parent.name,
+                  'wall_time_s': wall_time,
+                  'rows': self.rows,
+                  'rows_per_s': self.rows / wall_time if (self.rows is not None and wall_time > 0) else None,
+                  'peak_memory_mb': None,
+                  'status': 'ok' if exc_type is None else exc_type.__name__}
+        if self.memory and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            record['peak_memory_mb'] = (peak - self.memory_start) / 1024**2
+            if self.parent is not None:
+                self.parent.child_peak = max(self.parent.child_peak, peak)
+
+        for profiler in _profilers:
+            profiler._add_record(record)
+        for hook in _hooks:
+            hook(record)
+        return False
+
+
+class _NullStage:
+    '''
+    Stage that records nothing, used when no profiler or hook is active.
+    '''
+
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_null_stage = _NullStage()
+
+
+def stage(name, rows=None):
+    '''
+    Context manager to record a stage. Set the attribute rows of the returned stage to record the number of processed rows.
+
+    Example:
+        with stage('iff.parse') as st:
+            ...
+            st.rows = len(data)
+    '''
+
+    if _profilers or _hooks:
+        return _Stage(name, rows)
+    return _null_stage
+
+
+def profiled(rows=None):
+    '''
+    Decorator to record a function as a stage, named <module>.<function>.
+
+    Parameters
+    ----------
+    rows : callable
+        Optional function of the result of the decorated function, returning the number of processed rows.
+    '''
+
+    def decorator(function):
+        name = function.__module__.split('.')[-1] + '.' + function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not (_profilers or _hooks):
+                return function(*args, **kwargs)
+            with _Stage(name) as function_stage:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    function_stage.rows = rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+class Profiler:
+    '''
+    Context manager to record wall time, number of rows, throughput and peak memory of all pyhydro stages
+    (parsers, filters, geometry builders and writers) called within its context.
+    Without an active profiler or hook, stages are not recorded and add no measurable overhead.
+
+
+    Parameters
+    ----------
+    memory : bool
+        If True, peak memory of each stage is measured with tracemalloc. This slows down the stages. The default is False.
+    log_level : int
+        Optional logging level. If given, each record is also emitted to logger 'pyhydro.profiling'. The default is None.
+
+    Example
+    -------
+    with pyhydro.Profiler(memory=True) as profiler:
+        data = pyhydro.import_iff(path_iff)
+        data = pyhydro.cutoff_flowpath(data, tmax=25)
+    print(profiler.summary())
+    profiler.to_json('profile.json')
+    '''
+
+    def __init__(self, memory=False, log_level=None):
+        self.memory = memory
+        self.log_level = log_level
+        self.records = []
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        _profilers.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _profilers.remove(self)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return False
+
+    def _add_record(self, record):
+        self.records.append(record)
+        if self.log_level is not None:
+            logger.log(self.log_level, '%s: %.4f s, %s rows, %s MB', record['stage'], record['wall_time_s'],
+                       record['rows'], record['peak_memory_mb'], extra={'pyhydro_stage': record})
+
+    def to_dataframe(self):
+        '''
+        Returns all records as DataFrame, one row per stage.
+        '''
+
+        return pd.DataFrame(self.records, columns=['stage', 'parent', 'wall_time_s', 'rows', 'rows_per_s', 'peak_memory_mb', 'status'])
+
+    def summary(self):
+        '''
+        Returns number of calls, total wall time, total rows and maximum peak memory per stage.
+        '''
+
+        records = self.to_dataframe()
+        summary = records.groupby('stage', sort=False).agg(calls=('wall_time_s', 'size'),
+                                                           wall_time_s=('wall_time_s', 'sum'),
+                                                           rows=('rows', 'sum'),
+                                                           peak_memory_mb=('peak_memory_mb', 'max'))
+        summary.loc[:, 'rows_per_s'] = summary.loc[:, 'rows'] / summary.loc[:, 'wall_time_s']
+        return summary
+
+    def to_json(self, path=None):
+        '''
+        Returns all records as JSON string, and optionally saves them to path.
+        '''
+
+        records_json = json.dumps(self.records, indent=2)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(records_json)
+        return records_json
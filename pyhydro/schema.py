@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+#%%
+## Compact dtypes of integer columns of iMOD flowpath data. Other columns, like RD coordinates, are stored as float64.
+IFF_DTYPES = {'PARTICLE_NUMBER': np.int32,
+              'ILAY': np.int16,
+              'IROW': np.int32,
+              'ICOL': np.int32,
+              'CAPTURED_BY': np.int16}
+
+IPF_DTYPES = {'SP_ILAY': np.int16,
+              'SP_IROW': np.int32,
+              'SP_ICOL': np.int32,
+              'EP_ILAY': np.int16,
+              'EP_IROW': np.int32,
+              'EP_ICOL': np.int32,
+              'MAXLAYER': np.int16,
+              'IDENT.NO.': np.int32,
+              'CAPTURED_BY': np.int16}
+
+TIME_COLUMNS = ['TIME(YEARS)']
+
+
+def get_dtypes(columns, schema, float32_time=False):
+    '''
+    Returns the dtype of each column, according to schema (IFF_DTYPES or IPF_DTYPES).
+
+
+    Parameters
+    ----------
+    columns : list
+        Column names of the data.
+    schema : dict
+        Dictionary with dtypes of integer columns. Columns not in schema are float64.
+    float32_time : bool
+        If True, travel time columns are stored as float32. The default is False.
+
+    Returns
+    -------
+    dtypes : dict
+        Dictionary with column names as keys and dtypes as values.
+    '''
+
+    dtypes = {}
+    for column in columns:
+        if column in schema:
+            dtypes[column] = schema[column]
+        elif float32_time and column in TIME_COLUMNS:
+            dtypes[column] = np.float32
+        else:
+            dtypes[column] = np.float64
+    return dtypes
+
+
+def apply_schema(data, schema, float32_time=False):
+    '''
+    Converts columns of a dataframe to the dtypes of schema (IFF_DTYPES or IPF_DTYPES), see get_dtypes.
+    '''
+
+    return data.astype(get_dtypes(data.columns, schema, float32_time=float32_time))
+
+
+def memory_report(data, report=False):
+    '''
+    Report dtype and memory use of each column of a dataframe.
+
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        Dataframe, e.g. imported .iff or .ipf flowpath data.
+    report : bool
+        boolean to print the memory report. Either True or False. The default is False.
+
+    Returns
+    -------
+    memory : pd.DataFrame
+        Dataframe with dtype and memory use (MB) of each column and of the index, and the total memory use.
+    '''
+
+    memory_bytes = data.memory_usage(index=True, deep=True)
+    memory = pd.DataFrame({'dtype': [str(data.index.dtype)] + [str(dtype) for dtype in data.dtypes],
+                           'memory_mb': memory_bytes.values / 1024**2},
+                          index=memory_bytes.index)
+    memory.loc['Total'] = ['', memory.loc[:, 'memory_mb'].sum()]
+    if report:
+        print('Memory use of', str(len(data)), 'rows:')
+        print(memory)
+    return memory
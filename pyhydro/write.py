@@ -1,9 +1,9 @@
-import gdal
-import osr
+from .profiling import profiled
 
 
 #%%
 
+@profiled()
 def save_ipf_as_tif(Raster, ipf_xs, ipf_ys, file_path, file_name):
     '''
     saves .ipf rasters as .tif files, in RD_new format. 
@@ -29,6 +29,9 @@ def save_ipf_as_tif(Raster, ipf_xs, ipf_ys, file_path, file_name):
     
     '''
     
+    import gdal
+    import osr
+    
     ## Setting up GeoTransform, by calculating dx and dy. 
     dx = (ipf_xs[1:-1] - ipf_xs[0:-2]).mean()
     dy = (ipf_ys[1:-1] - ipf_ys[0:-2]).mean()
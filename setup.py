@@ -13,5 +13,7 @@ setup(name='pyhydro',
                         'imod',
                         'numpy',
                         'pandas',
-                        'shapely'],
+                        'scipy',
+                        'shapely',
+                        'xarray'],
       zip_safe=False)
\ No newline at end of file
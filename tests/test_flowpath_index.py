@@ -0,0 +1,79 @@
+'''
+Regression tests of the spatial index of flowpath segments, which should give the same result as testing all
+segments of all flowpaths, without duplicates and for any bucket size.
+
+Usage:
+    python -m pytest tests
+'''
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import generate_data
+import pyhydro
+from pyhydro import flowpath_index
+
+
+@pytest.fixture(scope='module')
+def data(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('flowpaths') / 'flowpaths.iff')
+    generate_data.write_iff(path, 20000, points_per_particle=50, nrow=40, ncol=40)
+    return pyhydro.import_iff(path)
+
+
+def get_queries(index, n=50, size=100., seed=0):
+    '''
+    Returns random query boxes (xmin, ymin, xmax, ymax), some of them partly outside the index.
+    '''
+
+    rng = np.random.default_rng(seed)
+    xmin = rng.uniform(index.xmin - size, index.xmin + index.nx * index.cell_size, n)
+    ymin = rng.uniform(index.ymin - size, index.ymin + index.ny * index.cell_size, n)
+    return xmin, ymin, xmin + rng.uniform(0, size, n), ymin + rng.uniform(0, size, n)
+
+
+def get_expected(index, xmin, ymin, xmax, ymax):
+    '''
+    Returns the result of query_bbox by testing all segments for all boxes.
+    '''
+
+    query = np.repeat(np.arange(len(xmin)), len(index))
+    segment = np.tile(np.arange(len(index)), len(xmin))
+    s = flowpath_index._get_entry_bbox(index.x0[segment], index.y0[segment], index.x1[segment], index.y1[segment],
+                                       xmin[query], ymin[query], xmax[query], ymax[query])
+    return index._get_result(query, segment, s)
+
+
+@pytest.mark.parametrize('cell_size', [None, 5., 50.])
+def test_query_bbox(data, cell_size):
+    index = pyhydro.build_flowpath_index(data, generate_data.get_wells(nrow=40, ncol=40), cell_size=cell_size)
+    xmin, ymin, xmax, ymax = get_queries(index)
+    query, segment = index._get_candidates(xmin, ymin, xmax, ymax)
+    assert not pd.Series(query * len(index) + segment).duplicated().any()
+
+    result = index.query_bbox(xmin, ymin, xmax, ymax)
+    assert len(result) > 0
+    pd.testing.assert_frame_equal(result, get_expected(index, xmin, ymin, xmax, ymax))
+
+
+def test_query_polygon(data):
+    index = pyhydro.build_flowpath_index(data, generate_data.get_wells(nrow=40, ncol=40))
+    xmin, ymin, xmax, ymax = get_queries(index)
+    boxes = [np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]]) for x0, y0, x1, y1 in zip(xmin, ymin, xmax, ymax)]
+    pd.testing.assert_frame_equal(index.query_polygon(boxes), index.query_bbox(xmin, ymin, xmax, ymax))
+
+
+def test_save_load(data, tmp_path):
+    index = pyhydro.build_flowpath_index(data)
+    index.save(str(tmp_path / 'index.npz'))
+    loaded = pyhydro.load_flowpath_index(str(tmp_path / 'index.npz'))
+    xmin, ymin, xmax, ymax = get_queries(index)
+    pd.testing.assert_frame_equal(loaded.query_radius(xmin, ymin, 50.), index.query_radius(xmin, ymin, 50.))
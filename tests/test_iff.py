@@ -0,0 +1,44 @@
+'''
+Regression tests of the parallel import of .iff files, which should give the same result as the serial import.
+
+Usage:
+    python -m pytest tests
+'''
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import generate_data
+import pyhydro
+
+
+@pytest.mark.parametrize('blank_lines', [False, True])
+def test_import_iff_parallel(tmp_path, blank_lines):
+    path = str(tmp_path / 'flowpaths.iff')
+    generate_data.write_iff(path, 20000)
+    if blank_lines:
+        with open(path) as file:
+            lines = file.readlines()
+        lines.insert(int(lines[0]) + 1 + 5000, '\n')
+        with open(path, 'w') as file:
+            file.writelines(lines)
+    data = pyhydro.import_iff(path, n_jobs=2, block_size=50000)
+    pd.testing.assert_frame_equal(data, pyhydro.import_iff(path))
+    ## Columns remain valid after the workers and shared memory names are gone.
+    assert np.isfinite(data.loc[:, 'XCRD.'].values).all()
+
+
+@pytest.mark.parametrize('n_jobs', [0, -2, 1.5])
+def test_import_iff_n_jobs(tmp_path, n_jobs):
+    path = str(tmp_path / 'flowpaths.iff')
+    generate_data.write_iff(path, 1000)
+    with pytest.raises(ValueError, match='n_jobs'):
+        pyhydro.import_iff(path, n_jobs=n_jobs)
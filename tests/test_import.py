@@ -0,0 +1,44 @@
+'''
+Import-time regression test of pyhydro. "import pyhydro" should stay within its time budget and should not load
+heavy dependencies, which are only imported by the functions that need them.
+
+Usage:
+    python -m pytest tests
+'''
+
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Maximum wall time in seconds of "import pyhydro", and modules it should not load.
+IMPORT_BUDGET = 0.5
+HEAVY_MODULES = ['imod', 'xarray', 'geopandas', 'shapely', 'gdal', 'osgeo', 'scipy']
+
+
+def get_import_time(repeat=5):
+    '''
+    Returns the median wall time of "import pyhydro" in a fresh interpreter, and the heavy modules it loaded.
+    '''
+
+    code = ('import sys, time; t = time.perf_counter(); import pyhydro; t = time.perf_counter() - t; '
+            'print(t); print(",".join(m for m in ' + repr(HEAVY_MODULES) + ' if m in sys.modules))')
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    times = []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, check=True).stdout.split('\n')
+        times.append(float(output[0]))
+    heavy_modules = [module for module in output[1].split(',') if module]
+    return statistics.median(times), heavy_modules
+
+
+def test_import_time():
+    import_time, heavy_modules = get_import_time()
+    assert import_time <= IMPORT_BUDGET, 'import pyhydro took ' + str(round(import_time, 3)) + ' s'
+
+
+def test_import_no_heavy_modules():
+    import_time, heavy_modules = get_import_time(repeat=1)
+    assert not heavy_modules, 'import pyhydro loaded ' + ', '.join(heavy_modules)
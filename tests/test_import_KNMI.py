@@ -0,0 +1,37 @@
+'''
+Regression tests of the KNMI station readers on synthetic files in the format of the KNMI data services.
+
+Usage:
+    python -m pytest tests
+'''
+
+import os
+import sys
+
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import generate_data
+import pyhydro
+
+
+def test_import_KNMIstation_daily(tmp_path):
+    path = str(tmp_path / 'KNMI_daily.txt')
+    generate_data.write_KNMI_daily(path, 1000)
+    metadata, data = pyhydro.Import_KNMIstation_daily(path)
+    assert len(data) == 1000
+    assert pd.api.types.is_datetime64_dtype(data.index)
+    assert (data.index[1:] - data.index[:-1] == pd.Timedelta(days=1)).all()
+
+
+def test_import_KNMIstation_hourly(tmp_path):
+    path = str(tmp_path / 'KNMI_hourly.txt')
+    generate_data.write_KNMI_hourly(path, 1000)
+    metastation, metadata, data = pyhydro.Import_KNMIstation_hourly(path)
+    assert len(data) == 1000
+    ## Hours 1-24 are hour-ending: hour 1 of a day ends at 01:00 of that day, hour 24 at 00:00 of the next day.
+    assert (data.index[1:] - data.index[:-1] == pd.Timedelta(hours=1)).all()
+    assert (data.index.hour == data.loc[:, 'HH'].astype(int) % 24).all()
@@ -0,0 +1,70 @@
+'''
+Regression tests of the interpolation of KNMI station data, at timesteps with missing station data.
+
+Usage:
+    python -m pytest tests
+'''
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from pyhydro import interpolate
+
+
+def get_data(n_stations=6, n_times=50, seed=0):
+    '''
+    Returns stations, stacked station data with missing values and grid coordinates.
+    '''
+
+    rng = np.random.default_rng(seed)
+    stations = pd.DataFrame({'X': rng.uniform(0, 10000, n_stations), 'Y': rng.uniform(0, 10000, n_stations)},
+                            index=np.arange(n_stations) + 200)
+    values = rng.uniform(0, 10, (n_times, n_stations))
+    values[rng.random((n_times, n_stations)) < 0.2] = np.nan
+    data_stack = pd.DataFrame(values, index=pd.date_range('2020-01-01', periods=n_times), columns=stations.index)
+    return stations, data_stack, np.arange(50., 10000., 500.), np.arange(9950., 0., -500.)
+
+
+@pytest.mark.parametrize('method', ['nearest', 'idw', 'kriging'])
+def test_missing_stations(method):
+    stations, data_stack, grid_xs, grid_ys = get_data()
+    interpolate.clear_interpolation_cache()
+    grid_values = interpolate.interpolate_KNMIdata(data_stack, stations, grid_xs, grid_ys, method=method, max_missing_weights=2)
+
+    ## Only the weights of all stations are cached, not those of the sets of missing stations.
+    assert len(interpolate._weights_cache) == 1
+    kwargs = {'variogram_range': interpolate.scipy.spatial.distance.pdist(stations.values).max() / 2} if method == 'kriging' else {}
+    for i, station_values in enumerate(data_stack.values):
+        valid = ~np.isnan(station_values)
+        if not valid.any():
+            assert np.isnan(grid_values[i]).all()
+            continue
+        weights = interpolate.get_interpolation_weights(stations.loc[valid], grid_xs, grid_ys, method=method, cache=False, **kwargs)
+        np.testing.assert_allclose(grid_values[i].ravel(), weights @ station_values[valid])
+    interpolate.clear_interpolation_cache()
+
+
+def test_max_missing_weights(monkeypatch):
+    stations, data_stack, grid_xs, grid_ys = get_data()
+    calls = []
+    get_interpolation_weights = interpolate.get_interpolation_weights
+    monkeypatch.setattr(interpolate, 'get_interpolation_weights', lambda *args, **kwargs: calls.append(kwargs) or get_interpolation_weights(*args, **kwargs))
+
+    ## Alternate between two sets of missing stations: with room for both, weights are derived once per set.
+    data_stack.loc[:, :] = 1.
+    data_stack.iloc[::2, 0] = np.nan
+    data_stack.iloc[1::2, 1] = np.nan
+    list(interpolate.iter_interpolated_KNMIdata(data_stack, stations, grid_xs, grid_ys, max_missing_weights=2))
+    assert len(calls) == 3
+    assert all(not kwargs['cache'] for kwargs in calls[1:])
+
+    calls.clear()
+    list(interpolate.iter_interpolated_KNMIdata(data_stack, stations, grid_xs, grid_ys, max_missing_weights=1))
+    assert len(calls) == 1 + len(data_stack)
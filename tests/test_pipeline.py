@@ -0,0 +1,57 @@
+'''
+Regression tests of the lazy flowpath pipeline, which should give the same result as the eager functions of iff,
+also on files with blank lines.
+
+Usage:
+    python -m pytest tests
+'''
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import generate_data
+import pyhydro
+from pyhydro import iff
+
+
+@pytest.fixture(params=[False, True], ids=['no_blank_lines', 'blank_lines'])
+def path_iff(request, tmp_path):
+    path = str(tmp_path / 'flowpaths.iff')
+    generate_data.write_iff(path, 20000, points_per_particle=50)
+    if request.param:
+        ## Insert a blank line at data row 100 and a line with only whitespace further on.
+        with open(path) as file:
+            lines = file.readlines()
+        nheader = int(lines[0]) + 1
+        lines.insert(nheader + 100, '\n')
+        lines.insert(nheader + 10000, '   \n')
+        with open(path, 'w') as file:
+            file.writelines(lines)
+    return path
+
+
+def test_import_iff_chunks(path_iff):
+    data = pd.concat(list(pyhydro.import_iff_chunks(path_iff, chunksize=1234)), ignore_index=True)
+    pd.testing.assert_frame_equal(data, pyhydro.import_iff(path_iff))
+
+
+def test_pipeline_extract_endpointwell(path_iff):
+    well_cell = generate_data.get_well_cells()[0]
+    data = pyhydro.scan_iff(path_iff, chunksize=1234).extract_endpointwell([well_cell]).collect()
+    expected = iff.extract_endpointwell(pyhydro.import_iff(path_iff), [well_cell])
+    assert len(data) > 0
+    pd.testing.assert_frame_equal(data, expected.reset_index(drop=True))
+
+
+def test_pipeline_cutoff_flowpath(path_iff):
+    well_cells = generate_data.get_well_cells()[:3]
+    data = pyhydro.scan_iff(path_iff, chunksize=1234).extract_endpointwell(well_cells).cutoff_flowpath(tmax=10, layer=1).collect()
+    expected = iff.cutoff_flowpath(iff.extract_endpointwell(pyhydro.import_iff(path_iff), well_cells), tmax=10, layer=1)
+    pd.testing.assert_frame_equal(data, expected.reset_index(drop=True))